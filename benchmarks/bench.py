@@ -0,0 +1,409 @@
+# -*- coding: utf-8 -*-
+"""Benchmark patch commands end-to-end against in-process fake CouchDB
+
+    python benchmarks/bench.py --docs 5000 --modes single,threads
+"""
+import os
+import re
+import sys
+import json
+import time
+import uuid
+import bisect
+import random
+import argparse
+import tempfile
+import threading
+import subprocess
+import urllib
+import urlparse
+import BaseHTTPServer
+import SocketServer
+from datetime import datetime, timedelta
+
+from openprocurement.patchdb.patcher import PatchApp
+
+
+DB_NAME = 'openprocurement'
+OLD_HOST = 'http://public.docs.example'
+AUCTION_DATE = '2017-07-20'
+METHOD_TYPES = ['belowThreshold', 'belowThreshold', 'aboveThresholdUA', 'aboveThresholdTS', 'belowThresholdRFP']
+STATUSES = ['active.tendering', 'active.tendering', 'active.auction', 'active.qualification', 'complete']
+
+COMMAND_ARGS = {
+    'cancel_auction': ['--auction-date', AUCTION_DATE],
+    'clone_tender': ['--clone-count', '1'],
+    'replace_documents_url': ['--doc-url-search', OLD_HOST, '--doc-url-replace', 'https://docs.example'],
+    'rollback_last_patch': ['--patch-label', 'bench'],
+}
+ALL_DOCS_OPTIONS = set(['keys', 'startkey', 'startkey_docid', 'endkey', 'inclusive_end',
+                        'descending', 'limit', 'include_docs'])
+CHANGES_OPTIONS = set(['since', 'limit'])
+MODES = {
+    'single': [],
+    'async': ['--async', '{workers}'],
+    'threads': ['-r', '{workers}'],
+    'processes': ['-f', '{workers}'],
+}
+
+
+class Corpus(object):
+    """Synthetic documents of realistic shape and size"""
+
+    def __init__(self, seed=1):
+        self.rnd = random.Random(seed)
+        self.counter = 0
+        self.date = datetime(2017, 7, 1, 10, 0, 0)
+
+    def hex(self):
+        return '%032x' % self.rnd.getrandbits(128)
+
+    def iso(self, days=0):
+        return (self.date + timedelta(days=days, seconds=self.rnd.randint(0, 86400))).isoformat() + '+03:00'
+
+    def document(self):
+        docid = self.hex()
+        return {
+            'id': docid,
+            'title': 'document-{}.pdf'.format(self.rnd.randint(1, 1000)),
+            'format': 'application/pdf',
+            'url': '{}/get/{}?KeyID=a1b2c3d4&Signature={}'.format(OLD_HOST, self.hex(), self.hex()),
+            'datePublished': self.iso(),
+            'dateModified': self.iso(),
+            'documentOf': 'tender',
+        }
+
+    def value(self):
+        return {'amount': self.rnd.randint(1000, 10000000) / 100.0, 'currency': 'UAH', 'valueAddedTaxIncluded': True}
+
+    def revisions(self, count):
+        revisions = list()
+        for n in range(count):
+            revisions.append({
+                'author': 'broker{}'.format(self.rnd.randint(1, 20)),
+                'date': self.iso(n // 10),
+                'rev': '{}-{}'.format(n + 1, self.hex()),
+                'changes': [{'op': 'replace', 'path': '/dateModified', 'value': self.iso(n // 10)},
+                            {'op': 'remove', 'path': '/bids/{}'.format(self.rnd.randint(0, 5))}],
+            })
+        return revisions
+
+    def tender(self):
+        self.counter += 1
+        pmt = self.rnd.choice(METHOD_TYPES)
+        status = self.rnd.choice(STATUSES)
+        lots = [{'id': self.hex(), 'title': 'Lot {}'.format(n + 1), 'status': 'active', 'value': self.value(),
+                 'auctionPeriod': {'startDate': '{}T1{}:00:00+03:00'.format(AUCTION_DATE, n)}}
+                for n in range(self.rnd.choice([0, 0, 1, 2, 5]))]
+        doc = {
+            '_id': self.hex(),
+            'doc_type': 'Tender',
+            'tenderID': 'UA-2017-07-{:02}-{:06}-a'.format(1 + self.counter % 28, self.counter),
+            'title': 'Tender {}'.format(self.counter),
+            'description': 'Synthetic tender for benchmark ' * 5,
+            'procurementMethodType': pmt,
+            'status': status,
+            'owner': 'broker',
+            'dateModified': self.iso(30),
+            'value': self.value(),
+            'procuringEntity': {'name': 'Entity', 'identifier': {'scheme': 'UA-EDR', 'id': str(self.counter)}},
+            'items': [{'id': self.hex(), 'description': 'Item', 'quantity': self.rnd.randint(1, 100),
+                       'classification': {'scheme': 'CPV', 'id': '44617100-9'}} for n in range(3)],
+            'documents': [self.document() for n in range(self.rnd.randint(1, 10))],
+            'bids': [{'id': self.hex(), 'status': 'active', 'date': self.iso(10), 'value': self.value(),
+                      'tenderers': [{'name': 'Tenderer', 'identifier': {'scheme': 'UA-EDR', 'id': self.hex()[:8]}}],
+                      'documents': [self.document() for n in range(self.rnd.randint(1, 5))],
+                      'lotValues': [{'relatedLot': lot['id'], 'value': self.value()} for lot in lots]}
+                     for n in range(self.rnd.randint(0, 20))],
+            'revisions': self.revisions(self.rnd.randint(10, 100)),
+        }
+        if lots:
+            doc['lots'] = lots
+        else:
+            doc['auctionPeriod'] = {'startDate': '{}T12:00:00+03:00'.format(AUCTION_DATE)}
+        if status == 'active.auction':
+            doc['auctionUrl'] = '{}/auctions/{}'.format(OLD_HOST, doc['_id'])
+        if pmt == 'belowThresholdRFP':
+            doc['auctionOptions'] = {'type': 'english'}
+        if pmt == 'aboveThresholdTS':
+            doc['features'] = [{'code': self.hex(), 'featureOf': 'tenderer', 'relatedItem': '',
+                                'title': 'Feature', 'enum': [{'value': 0.05, 'title': 'a'}]} for n in range(3)]
+        # last revision is reversible patch for rollback_last_patch
+        doc['revisions'].append({'author': 'patchdb/bench', 'date': self.iso(31), 'rev': '{}-{}'.format(
+                                 len(doc['revisions']) + 1, self.hex()),
+                                 'changes': [{'op': 'replace', 'path': '/title', 'value': 'Old title'}]})
+        return doc
+
+    def other(self, doc_type):
+        self.counter += 1
+        doc = {'_id': self.hex(), 'doc_type': doc_type, 'dateModified': self.iso(30), 'status': 'active',
+               'documents': [self.document() for n in range(3)], 'revisions': self.revisions(10)}
+        if doc_type == 'Plan':
+            doc['planID'] = 'UA-P-2017-07-01-{:06}'.format(self.counter)
+            doc['tender'] = {'procurementMethodType': 'belowThreshold'}
+        elif doc_type == 'Contract':
+            doc['contractID'] = 'UA-2017-07-01-{:06}-a-1'.format(self.counter)
+            doc['tender_id'] = self.hex()
+        else:
+            doc['auctionID'] = 'UA-EA-2017-07-01-{:06}'.format(self.counter)
+            doc['procurementMethodType'] = 'dgfOtherAssets'
+        return doc
+
+    def generate(self, count):
+        for n in range(count):
+            kind = self.rnd.random()
+            if kind < 0.7:
+                yield self.tender()
+            elif kind < 0.8:
+                yield self.other('Plan')
+            elif kind < 0.9:
+                yield self.other('Contract')
+            else:
+                yield self.other('Auction')
+
+
+class Unsupported(ValueError):
+    pass
+
+
+def check_options(name, query, allowed):
+    unknown = set(query) - allowed
+    if unknown:
+        raise Unsupported('{} options {} are not supported'.format(name, ', '.join(sorted(unknown))))
+
+
+class FakeCouch(object):
+    """In-memory database, documents are kept as encoded JSON, query
+    options not implemented here are rejected, not ignored"""
+
+    def __init__(self, docs):
+        self.lock = threading.Lock()
+        self.docs = dict()
+        self.ids = list()
+        self.seqs = dict()
+        self.changes = list()
+        for doc in docs:
+            doc['_rev'] = '1-' + uuid.uuid4().hex
+            self.store(doc)
+
+    def store(self, doc):
+        docid = doc['_id']
+        if docid not in self.docs:
+            bisect.insort(self.ids, docid)
+        self.docs[docid] = (doc['_rev'], json.dumps(doc))
+        self.changes.append(docid)
+        self.seqs[docid] = len(self.changes)
+
+    def save(self, doc):
+        with self.lock:
+            docid = doc.setdefault('_id', uuid.uuid4().hex)
+            current = self.docs.get(docid)
+            if current and current[0] != doc.get('_rev') or not current and doc.get('_rev'):
+                return {'id': docid, 'error': 'conflict', 'reason': 'Document update conflict.'}
+            gen = int(doc['_rev'].split('-')[0]) if current else 0
+            doc['_rev'] = '{}-{}'.format(gen + 1, uuid.uuid4().hex)
+            self.store(doc)
+            return {'id': docid, 'rev': doc['_rev'], 'ok': True}
+
+    def row(self, docid, include_docs):
+        item = self.docs.get(docid)
+        if not item:
+            return '{{"key":{0},"error":"not_found"}}'.format(json.dumps(docid))
+        row = '{{"id":{0},"key":{0},"value":{{"rev":"{1}"}}'.format(json.dumps(docid), item[0])
+        if include_docs:
+            row += ',"doc":' + item[1]
+        return row + '}'
+
+    def all_docs(self, query, keys=None):
+        check_options('_all_docs', query, ALL_DOCS_OPTIONS)
+        include_docs = query.get('include_docs') == 'true'
+        if keys is not None:
+            rows = [self.row(docid, include_docs) for docid in keys]
+        else:
+            start = json.loads(query['startkey']) if 'startkey' in query else query.get('startkey_docid')
+            end = json.loads(query['endkey']) if 'endkey' in query else None
+            inclusive_end = query.get('inclusive_end', 'true') == 'true'
+            limit = int(query.get('limit', len(self.ids)))
+            if query.get('descending') == 'true':
+                # startkey is upper and endkey is lower bound
+                upper = len(self.ids) if start is None else bisect.bisect_right(self.ids, start)
+                lower = 0 if end is None else (bisect.bisect_left if inclusive_end else bisect.bisect_right)(self.ids, end)
+                ids = self.ids[lower:upper][::-1][:limit]
+            else:
+                lower = 0 if start is None else bisect.bisect_left(self.ids, start)
+                upper = len(self.ids) if end is None else (bisect.bisect_right if inclusive_end else bisect.bisect_left)(self.ids, end)
+                ids = self.ids[lower:upper][:limit]
+            rows = [self.row(docid, include_docs) for docid in ids]
+        return '{{"total_rows":{},"offset":0,"rows":[\n{}\n]}}'.format(len(self.ids), ',\n'.join(rows))
+
+    def changes_feed(self, query):
+        check_options('_changes', query, CHANGES_OPTIONS)
+        since = int(query.get('since', 0) or 0)
+        limit = int(query.get('limit', 10000))
+        results = list()
+        for seq in range(since + 1, len(self.changes) + 1):
+            docid = self.changes[seq - 1]
+            if self.seqs[docid] != seq:
+                continue
+            results.append({'seq': seq, 'id': docid, 'changes': [{'rev': self.docs[docid][0]}]})
+            if len(results) >= limit:
+                break
+        last_seq = results[-1]['seq'] if results else max(since, len(self.changes))
+        return json.dumps({'results': results, 'last_seq': last_seq})
+
+
+class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def reply(self, code, body):
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(body)
+
+    def read_body(self):
+        length = int(self.headers.getheader('Content-Length') or 0)
+        return json.loads(self.rfile.read(length)) if length else {}
+
+    def handle_request(self):
+        try:
+            self.dispatch()
+        except Unsupported as e:
+            # harness must not measure different semantics than CouchDB
+            self.server.unsupported.add(str(e))
+            self.reply(400, json.dumps({'error': 'bad_request', 'reason': str(e)}))
+
+    def dispatch(self):
+        couch = self.server.couch
+        url = urlparse.urlparse(self.path)
+        query = dict((k, v[0]) for k, v in urlparse.parse_qs(url.query).items())
+        parts = [urllib.unquote(p) for p in url.path.strip('/').split('/') if p]
+        if not parts:
+            return self.reply(200, '{"couchdb":"Welcome","version":"1.6.1"}')
+        if parts[0] != DB_NAME:
+            return self.reply(404, '{"error":"not_found","reason":"no_db_file"}')
+        if len(parts) == 1:
+            if self.command == 'POST':
+                return self.reply(201, json.dumps(couch.save(self.read_body())))
+            return self.reply(200, json.dumps({'db_name': DB_NAME, 'doc_count': len(couch.ids),
+                                               'update_seq': len(couch.changes)}))
+        name = '/'.join(parts[1:])
+        if name == '_all_docs':
+            keys = self.read_body().get('keys') if self.command == 'POST' else None
+            if 'keys' in query:
+                keys = json.loads(query['keys'])
+            return self.reply(200, couch.all_docs(query, keys))
+        if name == '_changes':
+            return self.reply(200, couch.changes_feed(query))
+        if name == '_bulk_docs':
+            return self.reply(201, json.dumps([couch.save(doc) for doc in self.read_body()['docs']]))
+        if name.startswith('_') and not (name.startswith('_design/') and name.count('/') == 1):
+            raise Unsupported('{} is not supported'.format(name))
+        if self.command == 'PUT':
+            doc = self.read_body()
+            doc['_id'] = name
+            result = couch.save(doc)
+            return self.reply(409 if 'error' in result else 201, json.dumps(result))
+        item = couch.docs.get(name)
+        if not item:
+            return self.reply(404, '{"error":"not_found","reason":"missing"}')
+        return self.reply(200, item[1])
+
+    do_GET = do_HEAD = do_POST = do_PUT = handle_request
+
+
+class Server(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+def serve(couch):
+    server = Server(('127.0.0.1', 0), Handler)
+    server.couch = couch
+    server.unsupported = set()
+    thread = threading.Thread(target=server.serve_forever, name='FakeCouch')
+    thread.daemon = True
+    thread.start()
+    return server
+
+
+def run_command(port, command, mode, workers, extra):
+    fd, config = tempfile.mkstemp(suffix='.ini')
+    with os.fdopen(fd, 'w') as fp:
+        fp.write('[app:api]\ncouchdb.db_name = {}\ncouchdb.url = http://127.0.0.1:{}/\nid = a\n'.format(DB_NAME, port))
+    logfd, logname = tempfile.mkstemp(suffix='.log')
+    argv = [sys.executable, '-m', 'openprocurement.patchdb.main', command, '-c', config,
+            '-u', 'disable', '--write', '--progress', '0']
+    argv += [a.format(workers=workers) for a in MODES[mode]] + COMMAND_ARGS.get(command, []) + extra
+    try:
+        start = time.time()
+        process = subprocess.Popen(argv, stdout=logfd, stderr=logfd)
+        pid, status, rusage = os.wait4(process.pid, 0)
+        elapsed = time.time() - start
+        with open(logname) as fp:
+            lines = fp.read().splitlines()
+    finally:
+        os.close(logfd)
+        os.unlink(logname)
+        os.unlink(config)
+    found = [re.search(r'Patched (\d+) of (\d+) docs (\d+) changed (\d+) saved', line) for line in lines]
+    found = [m for m in found if m]
+    total = int(found[-1].group(2)) if found else 0
+    saved = int(found[-1].group(4)) if found else 0
+    if status or not found:
+        sys.stderr.write('\n'.join(lines[-10:]) + '\n')
+    return {'command': command, 'mode': mode, 'status': status, 'docs': total, 'saved': saved,
+            'seconds': elapsed, 'rate': total / elapsed, 'maxrss': rusage.ru_maxrss / 1024.0}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark patch commands on synthetic documents')
+    parser.add_argument('--docs', type=int, default=2000, help='number of documents (default 2000)')
+    parser.add_argument('--seed', type=int, default=1, help='random seed for corpus')
+    parser.add_argument('--commands', default=','.join(PatchApp.ALLOW_PATCHES),
+                        help='comma separated commands (default all)')
+    parser.add_argument('--modes', default='single,threads,processes',
+                        help='comma separated of {} (default single,threads,processes)'.format(','.join(MODES)))
+    parser.add_argument('--workers', type=int, default=4, help='threads, processes or async requests')
+    parser.add_argument('--json', metavar='FILE', help='also save results as JSON')
+    parser.add_argument('extra', nargs=argparse.REMAINDER, help='extra arguments passed to patchdb after --')
+    args = parser.parse_args()
+    extra = args.extra[1:] if args.extra[:1] == ['--'] else args.extra
+
+    start = time.time()
+    docs = [json.dumps(doc) for doc in Corpus(args.seed).generate(args.docs)]
+    size = sum(len(d) for d in docs)
+    print "Generated {} docs {:.1f} MB in {:.1f}s".format(len(docs), size / 1048576.0, time.time() - start)
+
+    results = list()
+    print "{:<24} {:<10} {:>7} {:>7} {:>8} {:>9} {:>8}".format(
+        'command', 'mode', 'docs', 'saved', 'seconds', 'docs/s', 'rss MB')
+    for command in args.commands.split(','):
+        for mode in args.modes.split(','):
+            couch = FakeCouch(json.loads(d) for d in docs)
+            server = serve(couch)
+            try:
+                res = run_command(server.server_address[1], command, mode, args.workers, extra)
+            finally:
+                server.shutdown()
+                server.server_close()
+            if server.unsupported:
+                sys.stderr.write('Fake CouchDB: {}\n'.format('; '.join(sorted(server.unsupported))))
+                res['status'] = res['status'] or 1
+            results.append(res)
+            print "{command:<24} {mode:<10} {docs:>7} {saved:>7} {seconds:>8.2f} {rate:>9.1f} {maxrss:>8.1f}{0}".format(
+                  ' FAILED' if res['status'] else '', **res)
+            sys.stdout.flush()
+    if args.json:
+        with open(args.json, 'w') as fp:
+            json.dump(results, fp, indent=2)
+    return any(r['status'] for r in results)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+import os
+import sqlite3
+import threading
+
+
+class DocCache(object):
+    """Local sqlite cache of documents keyed by id and rev, connection
+    is reopened after fork so each process writes through its own"""
+
+    def __init__(self, filename, decode, encode):
+        self.filename = filename
+        self.decode = decode
+        self.encode = encode
+        self.lock = threading.Lock()
+        self.conn = None
+        self.pid = None
+        self.hits = 0
+        self.misses = 0
+
+    def connect(self):
+        if self.pid != os.getpid():
+            self.conn = sqlite3.connect(self.filename, timeout=60, check_same_thread=False)
+            self.conn.execute('PRAGMA journal_mode=WAL')
+            self.conn.execute('CREATE TABLE IF NOT EXISTS docs (id TEXT PRIMARY KEY, rev TEXT, doc TEXT)')
+            self.pid = os.getpid()
+        return self.conn
+
+    def get_many(self, revs):
+        """Return dict of cached documents which rev is equal to revs[id]"""
+        ids = list(revs)
+        found = dict()
+        with self.lock:
+            conn = self.connect()
+            for i in range(0, len(ids), 500):
+                chunk = ids[i:i + 500]
+                query = 'SELECT id, rev, doc FROM docs WHERE id IN ({})'.format(','.join('?' * len(chunk)))
+                for docid, rev, doc in conn.execute(query, chunk):
+                    if revs[docid] == rev:
+                        found[docid] = doc
+            self.hits += len(found)
+            self.misses += len(ids) - len(found)
+        return dict((docid, self.decode(doc)) for docid, doc in found.items())
+
+    def put_many(self, docs):
+        rows = list()
+        for doc in docs:
+            text = self.encode(doc)
+            if isinstance(text, bytes):
+                text = text.decode('utf-8')
+            rows.append((doc['_id'], doc['_rev'], text))
+        with self.lock:
+            conn = self.connect()
+            with conn:
+                conn.executemany('INSERT OR REPLACE INTO docs (id, rev, doc) VALUES (?, ?, ?)', rows)
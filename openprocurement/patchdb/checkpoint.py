@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+import os
+import json
+import time
+import threading
+
+from .utils import LOG
+
+
+class Batch(list):
+    """List of (docid, doc) with sequence number and source position"""
+    seq = None
+    pos = None
+
+    def copy(self, items):
+        batch = Batch(items)
+        batch.seq = self.seq
+        batch.pos = self.pos
+        return batch
+
+
+class Checkpoint(object):
+    """Track last source position below which all batches are processed"""
+
+    def __init__(self, filename, source, interval=10.0):
+        self.filename = filename
+        self.source = source
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.pending = dict()
+        self.finished = set()
+        self.next_seq = 0
+        self.pos = None
+        self.saved_time = time.time()
+
+    def load(self, patch_name):
+        if not os.path.exists(self.filename):
+            LOG.warning("Checkpoint {} not found, start from begin".format(self.filename))
+            return None
+        with open(self.filename) as fp:
+            data = json.load(fp)
+        if data.get('source') != self.source or data.get('patch_name') != patch_name:
+            raise ValueError("Checkpoint {} was saved for {} {}".format(
+                             self.filename, data.get('patch_name'), data.get('source')))
+        LOG.info("Resume from {} {}".format(self.source, data['pos']))
+        self.pos = data['pos']
+        return data['pos']
+
+    def add(self, seq, pos):
+        with self.lock:
+            self.pending[seq] = pos
+
+    def done(self, seq):
+        with self.lock:
+            self.finished.add(seq)
+            while self.next_seq in self.finished:
+                self.finished.remove(self.next_seq)
+                self.pos = self.pending.pop(self.next_seq)
+                self.next_seq += 1
+
+    def save(self, patch_name, stat, force=False):
+        if not force and time.time() - self.saved_time < self.interval:
+            return
+        with self.lock:
+            self.saved_time = time.time()
+            if self.pos is None:
+                return
+            data = dict(stat, source=self.source, patch_name=patch_name, pos=self.pos,
+                        time=time.strftime('%Y-%m-%d %H:%M:%S'))
+            tmpname = self.filename + '.tmp'
+            with open(tmpname, 'w') as fp:
+                json.dump(data, fp, indent=2)
+            os.rename(tmpname, self.filename)
+        LOG.debug("Checkpoint {} {}".format(self.filename, self.pos))
@@ -1,3 +1,45 @@
+import importlib
+
+COMMANDS_GROUP = 'openprocurement.patchdb.commands'
+
+# name: (module:class, help) of built-in commands, the only place of their help,
+# module is imported only when command is selected; other packages add commands
+# by entry points in COMMANDS_GROUP with help in Command.help
+COMMANDS = {
+    'cancel_auction': ('openprocurement.patchdb.commands.cancel_auction:Command',
+                       'Cancel planned auction by removing startDate in auctionPeriod'),
+    'clone_tender': ('openprocurement.patchdb.commands.clone_tender:Command',
+                     'Create copy of tender document with same data but with new id and tenderID'),
+    'remove_auction_options': ('openprocurement.patchdb.commands.remove_auction_options:Command',
+                               'Remove unnecessary auctionOptions from tender'),
+    'remove_auction_period': ('openprocurement.patchdb.commands.remove_auction_period:Command',
+                              'Remove unnecessary auctionPeriod from RFP'),
+    'replace_documents_url': ('openprocurement.patchdb.commands.replace_documents_url:Command',
+                              'Replace domain in documents or auction URL'),
+    'rollback_last_patch': ('openprocurement.patchdb.commands.rollback_last_patch:Command',
+                            'Rollback last applieed patch by reverse revision changes'),
+    'update_ts_features': ('openprocurement.patchdb.commands.update_ts_features:Command',
+                           'Remove featureOf, relatedItem add default featureType:required in aboveThresholdTS'),
+}
+
+
+def plugin_commands():
+    """Commands registered by other packages in entry points group"""
+    import pkg_resources
+    commands = dict()
+    for entry_point in pkg_resources.iter_entry_points(COMMANDS_GROUP):
+        spec = '{}:{}'.format(entry_point.module_name, '.'.join(entry_point.attrs))
+        commands[entry_point.name] = (spec, '')
+    return commands
+
+
+def load_command(spec):
+    module_name, attr = spec.split(':')
+    target = importlib.import_module(module_name)
+    for name in attr.split('.'):
+        target = getattr(target, name)
+    return target
+
 
 class BaseCommand(object):
     help = ''
@@ -1,11 +1,10 @@
-from copy import deepcopy
 from datetime import timedelta
 from openprocurement.patchdb.commands import BaseCommand
 from openprocurement.patchdb.models import get_now
+from openprocurement.patchdb.cow import CowDict
 
 
 class Command(BaseCommand):
-    help = 'Cancel planned auction by removing startDate in auctionPeriod'
 
     @staticmethod
     def add_arguments(parser):
@@ -22,7 +21,7 @@ class Command(BaseCommand):
             return
         changed = False
         if 'lots' in doc and doc['lots']:
-            new = deepcopy(doc)
+            new = CowDict(doc)
             for lot in new['lots']:
                 if 'auctionPeriod' in lot and 'startDate' in lot['auctionPeriod'] and lot['auctionPeriod']['startDate']:
                     patcher.logger.debug("{} lot {} auctionPeriod {}".format(tender.id, lot['id'], lot['auctionPeriod']))
@@ -33,7 +32,7 @@ class Command(BaseCommand):
             if 'auctionPeriod' in doc and 'startDate' in doc['auctionPeriod'] and doc['auctionPeriod']['startDate']:
                 patcher.logger.debug("{} auctionPeriod {}".format(tender.id, doc['auctionPeriod']))
                 if 'endDate' not in doc['auctionPeriod'] and doc['auctionPeriod']['startDate'].startswith(self.auction_date):
-                    new = deepcopy(doc)
+                    new = CowDict(doc)
                     new['auctionPeriod'].pop('startDate')
                     changed = True
         if changed:
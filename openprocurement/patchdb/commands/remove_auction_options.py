@@ -1,15 +1,14 @@
-from copy import deepcopy
 from openprocurement.patchdb.commands import BaseCommand
+from openprocurement.patchdb.cow import CowDict
 
 
 class Command(BaseCommand):
-    help = 'Remove unnecessary auctionOptions from tender'
 
     def patch_tender(self, patcher, tender, doc):
         if tender.procurementMethodType != 'belowThresholdRFP':
             return
         if 'auctionOptions' in doc and doc['auctionOptions']:
-            new = deepcopy(doc)
+            new = CowDict(doc)
             new.pop('auctionOptions')
             patcher.save_tender(tender, doc, new)
             patcher.check_tender(tender, tender.tenderID)
@@ -1,9 +1,8 @@
-from copy import deepcopy
 from openprocurement.patchdb.commands import BaseCommand
+from openprocurement.patchdb.cow import CowDict
 
 
 class Command(BaseCommand):
-    help = 'Remove unnecessary auctionPeriod from RFP'
 
     def patch_tender(self, patcher, tender, doc):
         if tender.procurementMethodType != 'belowThresholdRFP':
@@ -11,14 +10,14 @@ class Command(BaseCommand):
         new = None
         changed = False
         if 'lots' in doc and doc['lots']:
-            new = deepcopy(doc)
+            new = CowDict(doc)
             for lot in new['lots']:
                 if 'auctionPeriod' in lot and lot['auctionPeriod']:
                     lot.pop('auctionPeriod')
                     changed = True
         if 'auctionPeriod' in doc and doc['auctionPeriod']:
             if not new:
-                new = deepcopy(doc)
+                new = CowDict(doc)
             new.pop('auctionPeriod')
             changed = True
         if changed:
@@ -1,14 +1,119 @@
 import re
-from copy import deepcopy
 from openprocurement.patchdb.commands import BaseCommand
+from openprocurement.patchdb.cow import CowDict, CowList
+
+
+LITERAL_RE = re.compile(r'^(?:[^.^$*+?{}\[\]\\|()]|\\\.)*$')
+
+
+def url_host(url):
+    # scheme://host part of URL, key of literal prefix rules
+    start = url.find('//')
+    if start < 0:
+        return None
+    end = url.find('/', start + 2)
+    return url if end < 0 else url[:end]
+
+
+def literal_prefix(search, replace):
+    """Return plain prefix if rule is literal URL with escaped dots and
+    host ending by slash, so it may be looked up by host of URL"""
+    if not LITERAL_RE.match(search) or '\\' in replace:
+        return None
+    prefix = search.replace('\\.', '.')
+    host = url_host(prefix)
+    if not host or len(prefix) <= len(host):
+        return None
+    return prefix
+
+
+class UrlRewriter(object):
+    """Rewrite URL by many search -> replace rules combined in one regexp,
+    rule matched leftmost wins (ties by order), literal prefix rules are
+    looked up by host and results of repeated URLs are memoized"""
+
+    cache_size = 100000
+
+    def __init__(self, rules):
+        self.rules = [(re.compile(search), replace) for search, replace in rules]
+        self.prefixes = dict()
+        self.first_regex = len(rules)
+        for index, (search, replace) in enumerate(rules):
+            prefix = literal_prefix(search, replace)
+            if prefix:
+                self.prefixes.setdefault(url_host(prefix), []).append((index, prefix, replace))
+            elif self.first_regex == len(rules):
+                self.first_regex = index
+        try:
+            self.combined = re.compile('|'.join(['(?P<r{}>{})'.format(index, search)
+                                                 for index, (search, replace) in enumerate(rules)]))
+        except re.error:
+            # group references in rules break numbering, match one by one
+            self.combined = None
+        self.cache = dict()
+
+    def __nonzero__(self):
+        return bool(self.rules)
+
+    def rewrite(self, url):
+        """Return new URL or None if not matched"""
+        if url in self.cache:
+            return self.cache[url]
+        result = self.rewrite_prefix(url)
+        if result is None:
+            index = self.match_rule(url)
+            if index is not None:
+                search, replace = self.rules[index]
+                result = search.sub(replace, url)
+        if result == url:
+            result = None
+        if len(self.cache) >= self.cache_size:
+            self.cache.clear()
+        self.cache[url] = result
+        return result
+
+    def rewrite_prefix(self, url):
+        # valid only when no regexp rule goes before matched prefix rule
+        for index, prefix, replace in self.prefixes.get(url_host(url), ()):
+            if index > self.first_regex:
+                break
+            if url.startswith(prefix):
+                return url.replace(prefix, replace)
+
+    def match_rule(self, url):
+        if self.combined:
+            match = self.combined.search(url)
+            return int(match.lastgroup[1:]) if match else None
+        found = [(m.start(), index) for index, m in
+                 enumerate([search.search(url) for search, replace in self.rules]) if m]
+        return min(found)[1] if found else None
+
+
+def read_url_map(filename):
+    """Read lines 'SEARCH REPLACE [doc|auction]' into lists of rules"""
+    doc_rules, auction_rules = list(), list()
+    with open(filename) as fp:
+        for lineno, line in enumerate(fp, 1):
+            parts = line.split()
+            if not parts or parts[0].startswith('#'):
+                continue
+            if len(parts) == 2:
+                parts.append('all')
+            if len(parts) != 3 or parts[2] not in ('all', 'doc', 'auction'):
+                raise ValueError("{}:{} expected SEARCH REPLACE [doc|auction]".format(filename, lineno))
+            search, replace, kind = parts
+            if kind in ('all', 'doc'):
+                doc_rules.append((search, replace))
+            if kind in ('all', 'auction'):
+                auction_rules.append((search, replace))
+    return doc_rules, auction_rules
 
 
 class Command(BaseCommand):
-    help = 'Replace domain in documents or auction URL'
-    required_document_fields = set(['id', 'title', 'format', 'url'])
-    required_auction_fields = set(['id', 'title', 'value', 'auctionUrl'])
-    auction_url_search = None
-    doc_url_search = None
+    required_document_fields = ('id', 'title', 'format', 'url')
+    required_auction_fields = ('id', 'title', 'value', 'auctionUrl')
+    document_keys = ('documents', 'financialDocuments', 'eligibilityDocuments', 'qualificationDocuments')
+    container_keys = ('awards', 'bids', 'cancellations', 'complaints', 'contracts', 'lots', 'qualifications')
 
     @staticmethod
     def add_arguments(parser):
@@ -20,46 +125,76 @@ class Command(BaseCommand):
                             help='auction URL to search (regexp)')
         parser.add_argument('--auction-url-replace', default='',
                             help='auction URL to replace')
+        parser.add_argument('--url-map', metavar='FILE',
+                            help='file of SEARCH REPLACE [doc|auction] lines, escape dots in URL prefixes for fast lookup')
+        parser.add_argument('--known-paths', action='store_true', default=False,
+                            help='faster search only in known document lists of tender, awards, bids, '
+                                 'cancellations, complaints, contracts, lots, qualifications')
 
     def check_arguments(self, args):
-        if not args.doc_url_search and not args.auction_url_search:
-            raise ValueError("Nothing to search")
+        doc_rules, auction_rules = list(), list()
         if args.doc_url_search:
-            self.doc_url_search = re.compile(args.doc_url_search)
-        self.doc_url_replace = args.doc_url_replace
+            doc_rules.append((args.doc_url_search, args.doc_url_replace))
         if args.auction_url_search:
-            self.auction_url_search = re.compile(args.auction_url_search)
-        self.auction_url_replace = args.auction_url_replace
+            auction_rules.append((args.auction_url_search, args.auction_url_replace))
+        if args.url_map:
+            file_doc_rules, file_auction_rules = read_url_map(args.url_map)
+            doc_rules.extend(file_doc_rules)
+            auction_rules.extend(file_auction_rules)
+        if not doc_rules and not auction_rules:
+            raise ValueError("Nothing to search")
+        self.doc_url = UrlRewriter(doc_rules)
+        self.auction_url = UrlRewriter(auction_rules)
+        self.known_paths = args.known_paths
+
+    def replace_url(self, root, rewriter, key, required_fields):
+        if not rewriter or not isinstance(root.get(key), basestring):
+            return False
+        if not all(name in root for name in required_fields):
+            return False
+        url = rewriter.rewrite(root[key])
+        if url is None:
+            return False
+        root[key] = url
+        return True
 
     def document_replace_url(self, doc):
-        if self.doc_url_search and self.doc_url_search.search(doc['url']):
-            doc['url'] = self.doc_url_search.sub(self.doc_url_replace, doc['url'])
-            return True
-        return False
+        return self.replace_url(doc, self.doc_url, 'url', self.required_document_fields)
 
     def auction_replace_url(self, doc):
-        if self.auction_url_search and self.auction_url_search.search(doc['auctionUrl']):
-            doc['auctionUrl'] = self.auction_url_search.sub(self.auction_url_replace, doc['auctionUrl'])
-            return True
-        return False
+        return self.replace_url(doc, self.auction_url, 'auctionUrl', self.required_auction_fields)
+
+    def known_find_and_replace(self, root):
+        res = self.auction_replace_url(root)
+        for key in self.document_keys:
+            for item in root.get(key) or ():
+                if isinstance(item, (dict, CowDict)):
+                    res += self.document_replace_url(item)
+        for key in self.container_keys:
+            for item in root.get(key) or ():
+                if isinstance(item, (dict, CowDict)):
+                    res += self.known_find_and_replace(item)
+        return res
 
     def recursive_find_and_replace(self, root):
         res = 0
-        if isinstance(root, dict):
-            if set(root.keys()) >= self.required_document_fields:
-                res += self.document_replace_url(root)
-            if set(root.keys()) >= self.required_auction_fields:
-                res += self.auction_replace_url(root)
+        if isinstance(root, (dict, CowDict)):
+            res += self.document_replace_url(root)
+            res += self.auction_replace_url(root)
             for item in root.values():
-                if isinstance(item, (dict, list)):
+                if isinstance(item, (dict, list, CowDict, CowList)):
                     res += self.recursive_find_and_replace(item)
-        elif isinstance(root, list):
+        elif isinstance(root, (list, CowList)):
             for item in root:
                 res += self.recursive_find_and_replace(item)
         return res
 
     def patch_tender(self, patcher, tender, doc):
-        new = deepcopy(doc)
-        if self.recursive_find_and_replace(new) > 0:
+        new = CowDict(doc)
+        if self.known_paths:
+            found = self.known_find_and_replace(new)
+        else:
+            found = self.recursive_find_and_replace(new)
+        if found > 0:
             patcher.save_tender(tender, doc, new)
             patcher.check_tender(tender, tender.tenderID)
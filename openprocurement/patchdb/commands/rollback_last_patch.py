@@ -3,7 +3,6 @@ from openprocurement.patchdb.commands import BaseCommand
 
 
 class Command(BaseCommand):
-    help = 'Rollback last applieed patch by reverse revision changes'
 
     @staticmethod
     def add_arguments(parser):
@@ -1,15 +1,14 @@
-from copy import deepcopy
 from openprocurement.patchdb.commands import BaseCommand
+from openprocurement.patchdb.cow import CowDict
 
 
 class Command(BaseCommand):
-    help = 'Remove featureOf, relatedItem add default featureType:required in aboveThresholdTS'
 
     def patch_tender(self, patcher, tender, doc):
         if tender.procurementMethodType != 'aboveThresholdTS':
             return
         if 'features' in doc and doc['features']:
-            new = deepcopy(doc)
+            new = CowDict(doc)
             for feature in new['features']:
                 feature.pop('featureOf', None)
                 feature.pop('relatedItem', None)
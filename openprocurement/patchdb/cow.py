@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+from collections import MutableMapping, MutableSequence
+
+from .utils import make_changes
+
+
+class CowBase(object):
+    """Copy-on-write proxy over dict or list, containers are copied
+    (shallow) only along mutated paths, untouched subtrees are shared"""
+    __slots__ = ('orig', 'data', 'parent', 'key', 'children')
+
+    def __init__(self, orig, parent=None, key=None):
+        self.orig = orig
+        self.data = None
+        self.parent = parent
+        self.key = key
+        self.children = dict()
+
+    @property
+    def dirty(self):
+        return self.data is not None
+
+    def current(self):
+        return self.orig if self.data is None else self.data
+
+    def materialize(self):
+        if self.data is not None:
+            return
+        self.data = self.orig.copy() if isinstance(self.orig, dict) else list(self.orig)
+        for key, child in self.children.items():
+            self.data[key] = child
+        self.children = None
+        if self.parent is not None:
+            self.parent.materialize()
+            self.parent.data[self.key] = self
+
+    def wrap(self, key, value):
+        if isinstance(value, CowBase) or not isinstance(value, (dict, list)):
+            return value
+        if self.data is None:
+            child = self.children.get(key)
+            if child is None:
+                child = self.children[key] = cow(value, self, key)
+            return child
+        child = self.data[key] = cow(value, self, key)
+        return child
+
+    def unwrap(self):
+        """Return plain document, original object if nothing changed"""
+        if self.data is None:
+            return self.orig
+        if isinstance(self.data, dict):
+            return dict((k, unwrap(v)) for k, v in self.data.items())
+        return [unwrap(v) for v in self.data]
+
+    def changes(self):
+        """RFC 6902 patch which reverts changes, for revision entry"""
+        return make_changes(self.unwrap(), self.orig)
+
+
+class CowDict(CowBase, MutableMapping):
+    __slots__ = ()
+
+    def __getitem__(self, key):
+        return self.wrap(key, self.current()[key])
+
+    def __setitem__(self, key, value):
+        self.materialize()
+        self.data[key] = value
+
+    def __delitem__(self, key):
+        self.materialize()
+        del self.data[key]
+
+    def __contains__(self, key):
+        return key in self.current()
+
+    def __iter__(self):
+        return iter(self.current())
+
+    def __len__(self):
+        return len(self.current())
+
+    def __repr__(self):
+        return 'CowDict({!r})'.format(self.unwrap())
+
+
+class CowList(CowBase, MutableSequence):
+    __slots__ = ()
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        return self.wrap(index, self.current()[index])
+
+    def __setitem__(self, index, value):
+        self.materialize()
+        self.data[index] = value
+
+    def __delitem__(self, index):
+        self.materialize()
+        del self.data[index]
+        self.reindex()
+
+    def insert(self, index, value):
+        self.materialize()
+        self.data.insert(index, value)
+        self.reindex()
+
+    def reindex(self):
+        for i in range(len(self.data)):
+            if isinstance(self.data[i], CowBase):
+                self.data[i].key = i
+
+    def __len__(self):
+        return len(self.current())
+
+    def __repr__(self):
+        return 'CowList({!r})'.format(self.unwrap())
+
+
+def cow(value, parent=None, key=None):
+    if isinstance(value, dict):
+        return CowDict(value, parent, key)
+    if isinstance(value, list):
+        return CowList(value, parent, key)
+    return value
+
+
+def unwrap(value):
+    if isinstance(value, CowBase):
+        return value.unwrap()
+    return value
@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+import sys
+import gzip
+
+
+def open_dump(filename):
+    if filename == '-':
+        return sys.stdin
+    if filename.endswith('.gz'):
+        return gzip.open(filename, 'rb')
+    return open(filename, 'rb')
+
+
+def iter_dump(fp, decode, start=0):
+    """Yield (line number, document) from newline delimited JSON dump or
+    from _all_docs?include_docs=true output with one row per line"""
+    for lineno, line in enumerate(fp):
+        if lineno < start:
+            continue
+        line = line.strip().rstrip(',')
+        if not line.startswith('{') or line.startswith('{"total_rows"'):
+            continue
+        item = decode(line)
+        if 'doc' in item and 'id' in item and 'key' in item:
+            item = item['doc']
+        if item:
+            yield lineno, item
@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+import time
+import socket
+import multiprocessing
+from couchdb.http import Session, ServerError
+
+from .utils import LOG
+
+
+class RateLimiter(object):
+    """Adaptive requests rate shared by threads and forked processes,
+    samples of all workers are counted in shared state, rate is cut when
+    more than 5% of requests are slower than target or server errors occur
+    and slowly grows back (up to max_rate) while database is healthy,
+    zero rate is unlimited and it is the start rate without max_rate"""
+
+    DECREASE = 0.7
+    INCREASE = 0.1
+    SLOW_SHARE = 0.05
+
+    def __init__(self, max_rate=0, target_latency=0, min_rate=1.0, interval=1.0):
+        self.max_rate = max_rate
+        self.target_latency = target_latency
+        self.min_rate = min_rate
+        self.interval = interval
+        # rate, next request time, last adjust time, requests, errors, slow requests
+        self.shared = multiprocessing.Array('d', [max_rate, 0.0, time.time(), 0, 0, 0])
+
+    @property
+    def rate(self):
+        return self.shared[0]
+
+    def acquire(self):
+        with self.shared.get_lock():
+            if not self.shared[0]:
+                return
+            now = time.time()
+            slot = max(self.shared[1], now)
+            self.shared[1] = slot + 1.0 / self.shared[0]
+        if slot > now:
+            time.sleep(slot - now)
+
+    def feedback(self, seconds, error=False):
+        shared = self.shared
+        with shared.get_lock():
+            shared[3] += 1
+            shared[4] += bool(error)
+            shared[5] += bool(self.target_latency and seconds > self.target_latency)
+            now = time.time()
+            elapsed = now - shared[2]
+            if elapsed < self.interval:
+                return
+            self.adjust(elapsed)
+            shared[2] = now
+            shared[3] = shared[4] = shared[5] = 0
+
+    def adjust(self, elapsed):
+        rate, count, errors, slow = self.shared[0], self.shared[3], self.shared[4], self.shared[5]
+        if errors or slow > self.SLOW_SHARE * count:
+            # unlimited rate is cut from actual one
+            new_rate = max(self.min_rate, (rate or count / elapsed) * self.DECREASE)
+            LOG.info("Slow down to {:.1f} rps, {:.0f} of {:.0f} slow {:.0f} errors".format(
+                     new_rate, slow, count, errors))
+        elif rate and count >= 0.5 * rate * elapsed:
+            # speed up only when limit is actually reached
+            new_rate = rate + max(1.0, rate * self.INCREASE)
+            if self.max_rate:
+                new_rate = min(new_rate, self.max_rate)
+            if new_rate != rate:
+                LOG.debug("Speed up to {:.1f} rps".format(new_rate))
+        else:
+            return
+        self.shared[0] = new_rate
+
+
+class LimitedSession(Session):
+    """CouchDB session which passes every request through limiter"""
+
+    def __init__(self, limiter, **kwargs):
+        Session.__init__(self, **kwargs)
+        self.limiter = limiter
+
+    def request(self, method, url, *args, **kwargs):
+        if 'feed=longpoll' in url:
+            return Session.request(self, method, url, *args, **kwargs)
+        self.limiter.acquire()
+        start = time.time()
+        error = False
+        try:
+            return Session.request(self, method, url, *args, **kwargs)
+        except (ServerError, socket.error):
+            error = True
+            raise
+        finally:
+            self.limiter.feedback(time.time() - start, error)
@@ -1,6 +1,7 @@
 # -*- coding: utf-8 -*-
 import sys
 import time
+import Queue
 import logging
 import threading
 import multiprocessing
@@ -26,23 +27,39 @@ def main():
         LOG.info("Start {} processes...".format(app.args.processes))
 
         processes_list = list()
-        modulus = app.args.processes
-        shared_stat = multiprocessing.Array('i', 4 * modulus, lock=False)
+        size = app.args.processes
+        queue = multiprocessing.Queue(maxsize=2 * size)
+        shared_stat = multiprocessing.Array('i', 4 * size, lock=False)
+        app.shared_changed = multiprocessing.Value('i', 0)
+        done_queue = multiprocessing.Queue() if app.checkpoint else None
+        stats_queue = multiprocessing.Queue()
+        written_queue = multiprocessing.Queue()
+        app.written_queue = written_queue
         is_alive = 0
-        for remainder in range(modulus):
-            process_name = "Process-{}".format(remainder + 1)
+        for index in range(size):
+            process_name = "Process-{}".format(index + 1)
             process = multiprocessing.Process(target=app.patch_process,
-                                              args=(modulus, remainder, shared_stat),
+                                              args=(queue, shared_stat, index, done_queue, stats_queue, written_queue),
                                               name=process_name)
             processes_list.append(process)
             process.daemon = True
             process.start()
             is_alive += 1
 
+        feeder = threading.Thread(target=app.feed_queue, args=(queue, size), name='Feeder')
+        feeder.daemon = True
+        feeder.start()
+
         try:
             while is_alive:
                 is_alive = 0
                 time.sleep(0.01)
+                if app.has_error:
+                    raise RuntimeError("Abort by feeder")
+                app.drain_done(done_queue, shared_stat, size)
+                app.drain_stats(stats_queue)
+                app.drain_written(written_queue)
+                app.report_progress()
                 for p in processes_list:
                     if p.is_alive():
                         is_alive += 1
@@ -54,13 +71,21 @@ def main():
             LOG.error("{} {}".format(type(e).__name__, e))
             app.has_error = True
             for process in processes_list:
-                if p.is_alive():
+                if process.is_alive():
                     process.terminate()
             for process in processes_list:
-                if p.is_alive():
+                if process.is_alive():
                     process.join(1)
         finally:
-            app.update_stat(shared_stat, size=modulus)
+            app.feed_stop.set()
+            queue.cancel_join_thread()
+            app.drain_done(done_queue, shared_stat, size)
+            app.drain_stats(stats_queue)
+            app.drain_written(written_queue)
+            app.update_stat(shared_stat, size=size)
+            app.save_checkpoint(force=True)
+            app.merge_profile()
+            app.report_progress(force=True)
             app.print_total()
             logging.shutdown()
 
@@ -70,14 +95,19 @@ def main():
 
         threads_list = list()
         app.lock = threading.Lock()
-        modulus = app.args.concurrency
-        for remainder in range(modulus):
+        size = app.args.concurrency
+        queue = Queue.Queue(maxsize=2 * size)
+        for index in range(size):
             thread = threading.Thread(target=app.patch_thread,
-                                      args=(modulus, remainder))
+                                      args=(queue,))
             threads_list.append(thread)
             thread.daemon = True
             thread.start()
 
+        feeder = threading.Thread(target=app.feed_queue, args=(queue, size), name='Feeder')
+        feeder.daemon = True
+        feeder.start()
+
         try:
             for thread in threads_list:
                 thread.join(0.1)
@@ -89,15 +119,26 @@ def main():
             for thread in threads_list:
                 thread.join(1)
         finally:
+            app.feed_stop.set()
+            app.close_verifier(cancel=app.has_error)
+            app.save_checkpoint(force=True)
+            app.merge_profile()
+            app.report_progress(force=True)
             app.print_total()
             logging.shutdown()
 
-    else:  # single thread
+    else:  # single thread, optionally with --async requests
         try:
-            app.patch_all()
+            with app.profiled('MainThread'):
+                app.patch_all()
         except KeyboardInterrupt:
             LOG.error('Program interrupted!')
+            app.has_error = True
         finally:
+            app.close_verifier(cancel=app.has_error)
+            app.save_checkpoint(force=True)
+            app.merge_profile()
+            app.report_progress(force=True)
             app.print_total()
             logging.shutdown()
 
@@ -1,15 +1,12 @@
 # -*- coding: utf-8 -*-
 import os
 import re
+import random
+import threading
 from time import sleep
 from uuid import uuid4
 from pytz import timezone
 from datetime import datetime
-from iso8601 import parse_date
-from schematics.models import Model
-from schematics.types import BaseType, StringType
-from schematics.types.compound import DictType, ListType, ModelType as BaseModelType
-from couchdb_schematics.document import SchematicsDocument
 
 
 TZ = timezone(os.environ['TZ'] if 'TZ' in os.environ else 'Europe/Kiev')
@@ -37,98 +34,112 @@ def shadow_save(db, doc, write=False):
     DB_SHADOW[key] = doc
 
 
-def generate_tender_id(tenderID, db, server_id=None, write=False):
-    # for UA-2017-07-12-000293-c
-    # group(1): UA-
-    # group(2): 2017-07-12
-    # group(3): 000293
-    # group(4): -c
-    m = re.match(r'([\w\d\-]{1,10}-)(\d{4}-\d{2}-\d{2})-(\d{6})(-[\w\d]{1,3})?', tenderID)
-    if not m:
-        raise ValueError('tenderID dont match standart regex')
-    if not server_id and m.group(4):
-        server_id = m.group(4)[1:]
-    key = m.group(2)
-    tenderIDdoc = 'tenderID_' + server_id if server_id else 'tenderID'
-    max_retry = 10
-    for retry in range(max_retry):
-        try:
-            tenderID = shadow_get(db, tenderIDdoc, {'_id': tenderIDdoc})
-            index = tenderID.get(key, 1)
-            tenderID[key] = index + 1
-            shadow_save(db, tenderID, write)
-            break
-        except Exception as e:  # pragma: no cover
-            if retry >= max_retry - 1:
-                raise e
-            sleep(0.1)
-    return '{}{}-{:06}{}'.format(m.group(1), m.group(2), index, server_id and '-' + server_id)
-
-
-def parse_local_date(s):
-    date = parse_date(s, None)
-    if not date.tzinfo:
-        date = TZ.localize(date)
-    return date
-
+class TenderIDAllocator(object):
+    """Reserve block of tenderID indexes per date key by one update of
+    counter document and hand them out from local pool, pool is reset
+    after fork so each process reserves own blocks"""
 
-class IsoDateTimeType(BaseType):
-    MESSAGES = {
-        'parse': u'Could not parse {0}. Should be ISO8601.',
-    }
-
-    def to_native(self, value, context=None):
-        if isinstance(value, datetime):
-            return value
-        date = parse_date(value, None)
-        if not date.tzinfo:
-            date = TZ.localize(date)
-        return date
-
-    def to_primitive(self, value, context=None):
-        return value.isoformat()
+    max_retry = 10
 
+    def __init__(self, server_id=None, write=False, block=1):
+        self.server_id = server_id
+        self.write = write
+        self.block = block
+        self.lock = threading.Lock()
+        self.pools = dict()
+        self.pid = os.getpid()
+
+    def reserve(self, db, docid, key):
+        for retry in range(self.max_retry):
+            try:
+                counter = shadow_get(db, docid, {'_id': docid})
+                index = counter.get(key, 1)
+                counter[key] = index + self.block
+                shadow_save(db, counter, self.write)
+                return [index, index + self.block]
+            except Exception as e:  # pragma: no cover
+                if retry >= self.max_retry - 1:
+                    raise e
+                sleep(random.uniform(0.05, 0.15))
+
+    def allocate(self, tenderID, db):
+        # for UA-2017-07-12-000293-c
+        # group(1): UA-
+        # group(2): 2017-07-12
+        # group(3): 000293
+        # group(4): -c
+        m = re.match(r'([\w\d\-]{1,10}-)(\d{4}-\d{2}-\d{2})-(\d{6})(-[\w\d]{1,3})?', tenderID)
+        if not m:
+            raise ValueError('tenderID dont match standart regex')
+        server_id = self.server_id
+        if not server_id and m.group(4):
+            server_id = m.group(4)[1:]
+        key = m.group(2)
+        docid = 'tenderID_' + server_id if server_id else 'tenderID'
+        with self.lock:
+            if self.pid != os.getpid():
+                self.pools = dict()
+                self.pid = os.getpid()
+            pool = self.pools.get((docid, key))
+            if not pool or pool[0] >= pool[1]:
+                pool = self.pools[(docid, key)] = self.reserve(db, docid, key)
+            index = pool[0]
+            pool[0] += 1
+        return '{}{}-{:06}{}'.format(m.group(1), m.group(2), index, '-' + server_id if server_id else '')
+
+
+class TenderView(object):
+    """Lightweight read-only view over raw tender document,
+    revisions are converted to models only when requested"""
+    __slots__ = ('doc', '_revisions')
+
+    def __init__(self, doc):
+        self.doc = doc
+        self._revisions = None
 
-class Period(Model):
-    startDate = IsoDateTimeType()  # The state date for the period.
-    endDate = IsoDateTimeType()  # The end date for the period.
+    @property
+    def id(self):
+        return self.doc.get('_id')
 
+    @property
+    def rev(self):
+        return self.doc.get('_rev')
 
-class Revision(Model):
-    author = StringType()
-    date = IsoDateTimeType(default=get_now)
-    changes = ListType(DictType(BaseType), default=list())
-    rev = StringType()
+    @property
+    def doc_type(self):
+        return self.doc.get('doc_type')
 
+    @property
+    def dateModified(self):
+        return self.doc.get('dateModified')
 
-class ModelType(BaseModelType):
-    # disable default strict mode for partial data
-    def __init__(self, model_class, **kwargs):
-        BaseModelType.__init__(self, model_class, **kwargs)
-        if getattr(self, 'strict', False):
-            self.strict = False
+    @property
+    def procurementMethodType(self):
+        return self.doc.get('procurementMethodType')
 
+    @property
+    def status(self):
+        return self.doc.get('status')
 
-class Tender(SchematicsDocument, Model):
-    dateModified = IsoDateTimeType()
-    procurementMethodType = StringType()
-    revisions = ListType(ModelType(Revision), default=list())
-    tenderID = StringType()
-    status = StringType()
+    @property
+    def tenderID(self):
+        return self.doc.get('tenderID')
 
+    @property
+    def revisions(self):
+        if self._revisions is None:
+            from .schemas import Revision
+            self._revisions = [Revision().import_data(r, partial=True)
+                               for r in self.doc.get('revisions', [])]
+        return self._revisions
 
-class PlanTender(Model):
-    """Tender for planning model """
-    procurementMethod = StringType(default='')
-    procurementMethodType = StringType(default='')
-    tenderPeriod = ModelType(Period, required=True)
 
+class PlanView(TenderView):
+    __slots__ = ()
 
-class Plan(SchematicsDocument, Model):
-    dateModified = IsoDateTimeType()
-    tender = ModelType(PlanTender, required=True)
-    planID = StringType()
-    revisions = ListType(ModelType(Revision), default=list())
+    @property
+    def planID(self):
+        return self.doc.get('planID')
 
     @property
     def tenderID(self):
@@ -136,19 +147,23 @@ class Plan(SchematicsDocument, Model):
 
     @property
     def procurementMethodType(self):
-        return self.tender.procurementMethodType
+        return (self.doc.get('tender') or {}).get('procurementMethodType', '')
 
     @property
     def status(self):
         return 'plan'
 
 
-class Contract(SchematicsDocument, Model):
-    revisions = ListType(ModelType(Revision), default=list())
-    dateModified = IsoDateTimeType()
-    contractID = StringType()
-    tender_id = StringType()
-    status = StringType()
+class ContractView(TenderView):
+    __slots__ = ()
+
+    @property
+    def contractID(self):
+        return self.doc.get('contractID')
+
+    @property
+    def tender_id(self):
+        return self.doc.get('tender_id')
 
     @property
     def tenderID(self):
@@ -159,12 +174,12 @@ class Contract(SchematicsDocument, Model):
         return 'contract'
 
 
-class Auction(SchematicsDocument, Model):
-    auctionID = StringType()
-    dateModified = IsoDateTimeType()
-    procurementMethodType = StringType()
-    revisions = ListType(ModelType(Revision), default=list())
-    status = StringType()
+class AuctionView(TenderView):
+    __slots__ = ()
+
+    @property
+    def auctionID(self):
+        return self.doc.get('auctionID')
 
     @property
     def tenderID(self):
@@ -1,25 +1,37 @@
 # -*- coding: utf-8 -*-
 import os
 import sys
+import time
+import Queue
 import argparse
-import importlib
+import multiprocessing
+import threading
+from contextlib import contextmanager
 from ConfigParser import ConfigParser
-from couchdb import Server, Session
-from couchdb.http import ResourceConflict
 
-from .utils import get_with_retry, get_revision_changes, with_retry, LOG
-from .models import get_now, generate_id, generate_tender_id, Tender, Plan, Contract, Auction
+from .utils import JSON_BACKENDS, get_with_retry, set_api_limiter, get_revision_changes, with_retry, prefetch, set_pool_size, select_json_backend, benchmark_json, json_sample, LOG
+from .pool import RequestPool
+from .verifier import Verifier
+from .cache import DocCache
+from .dump import open_dump, iter_dump
+from .profiling import Profiler
+from .checkpoint import Batch, Checkpoint
+from .stats import Stats, merge_snapshots, format_progress, write_metrics
+from .views import sync_design_doc, sync_mango_index, narrowest_ranges, filter_ranges, PROJECTION_DOC, PROJECTION_VIEW
+from .cow import unwrap
+from .commands import COMMANDS, plugin_commands, load_command
+from .models import get_now, generate_id, TenderIDAllocator, TenderView, PlanView, ContractView, AuctionView
 
 __version__ = '0.15'
 
 
 class PatchApp(object):
-    ALLOW_PATCHES = ['cancel_auction', 'clone_tender', 'remove_auction_options', 'remove_auction_period',
-                     'replace_documents_url', 'rollback_last_patch', 'update_ts_features']
+    ALLOW_PATCHES = sorted(COMMANDS)
     ALLOW_DOCTYPE = ['Tender', 'Plan', 'Contract', 'Auction']
+    STAT = ['total', 'patched', 'changed', 'saved']
 
     def __init__(self, argv):
-        self.load_commands()
+        self.load_commands(argv)
         self.parse_arguments(argv)
         self.has_error = False
         self.total = 0
@@ -28,6 +40,44 @@ class PatchApp(object):
         self.created = 0
         self.saved = 0
         self.lock = None
+        self.writer = None
+        self.pool = None
+        self.verifier = None
+        self.limiter = None
+        self.cache = None
+        self.output = None
+        self.tender_ids = None
+        self.db = None
+        self.profiler = None
+        self.json_codec = None
+        self.view_ranges = None
+        self.source_end = None
+        self.written_ids = set()
+        self.row_filter = None
+        self.mango_index = None
+        self.prefiltered = 0
+        self.shared_changed = None
+        self.shared_stat = None
+        self.stat_index = None
+        self.feed_stop = threading.Event()
+        self.checkpoint = None
+        self.resume_pos = None
+        self.source_pos = None
+        self.batch_seq = 0
+        self.done_batches = list()
+        self.done_queue = None
+        self.commit_lock = threading.Lock()
+        self.check_lock = threading.Lock()
+        self.local = threading.local()
+        self.deferred_checks = list()
+        self.check_seen = 0
+        self.commit_time = time.time()
+        self.stats = Stats()
+        self.stats_queue = None
+        self.written_queue = None
+        self.child_stats = dict()
+        self.progress_time = time.time()
+        self.expected_total = None
 
     def parse_arguments(self, argv):
         formatter_class = argparse.RawDescriptionHelpFormatter
@@ -40,12 +90,14 @@ class PatchApp(object):
         subparsers = parser.add_subparsers(dest='patch_name', metavar='patch_name')
 
         common = argparse.ArgumentParser(add_help=False)
-        common.add_argument('-c', '--config', required=True,
-                            help='path to openprocurement.api.ini (required)')
+        common.add_argument('-c', '--config',
+                            help='path to openprocurement.api.ini (required unless --input)')
         common.add_argument('-r', '--concurrency', type=int, default=0,
                             help='number of concurent threads for performing requests')
         common.add_argument('-f', '--processes', type=int, default=0,
                             help='number of concurent processes for performing requests')
+        common.add_argument('--async', type=int, default=0, dest='async_requests', metavar='N',
+                            help='number of requests in flight from single patching thread')
         common.add_argument('-v', '--verbose', dest='verbose_count',
                             action='count', default=0,
                             help='for more verbose use multiple times')
@@ -79,20 +131,77 @@ class PatchApp(object):
                             help='stop after patch (change) N tenders')
         common.add_argument('-u', '--api-url', default='127.0.0.1:8080',
                             help='url to API (default 127.0.0.1:8080) or "disable"')
+        common.add_argument('--max-rate', type=float, default=0, metavar='RPS',
+                            help='max couchdb and API requests per second for all workers (default unlimited)')
+        common.add_argument('--target-latency', type=float, default=0, metavar='MS',
+                            help='slow down when couchdb or API p95 latency exceeds MS milliseconds')
+        common.add_argument('--check-concurrency', type=int, default=4, metavar='N',
+                            help='number of background API checkers (default 4, 0 - check inline)')
+        common.add_argument('--check-every', type=int, default=1, metavar='N',
+                            help='check only every Nth patched document (default 1 - all)')
+        common.add_argument('--defer-check', action='store_true', default=False,
+                            help='check created documents after batch is saved, not one by one (default no)')
         common.add_argument('-m', '--dateModified', action='store_true',
                             help='update tender.dateModified (default no)')
+        common.add_argument('--input', metavar='FILE',
+                            help='read documents from NDJSON or _all_docs dump instead of couchdb')
+        common.add_argument('--output', metavar='FILE',
+                            help='save patched documents as NDJSON for later _bulk_docs upload')
         common.add_argument('--changes', action='store_true', default=False,
                             help='process documents by changes feed (default all_docs)')
-        common.add_argument('--cjson', action='store_true', default=False,
-                            help='use fast cjson library (default simplejson)')
+        common.add_argument('--follow', action='store_true', default=False,
+                            help='keep waiting for new changes, implies --changes and --resume')
+        common.add_argument('--views', action='store_true', default=False,
+                            help='pre-filter documents by patchdb design views (default no)')
+        common.add_argument('--sync-views', action='store_true', default=False,
+                            help='install or update design views and mango index, even without --write')
+        common.add_argument('--prefilter', action='store_true', default=False,
+                            help='filter by projection view, fetch only matched documents (default no)')
+        common.add_argument('--selector', metavar='JSON',
+                            help='select documents by Mango query, requires CouchDB 2.x (default none)')
+        common.add_argument('--batch-size', type=int, default=100,
+                            help='fetch documents by batches of N (default 100)')
+        common.add_argument('--prefetch', type=int, default=200,
+                            help='fetch up to N documents ahead in background (default 200)')
+        common.add_argument('--cache', metavar='FILE',
+                            help='keep fetched documents in local sqlite cache between runs')
+        common.add_argument('--bulk-size', type=int, default=0,
+                            help='save documents by _bulk_docs batches of N (default 0 - one by one)')
+        common.add_argument('--bulk-delay', type=float, default=5.0,
+                            help='max seconds to hold document in bulk buffer (default 5)')
+        common.add_argument('--id-block', type=int, default=1, metavar='N',
+                            help='reserve new tenderID indexes by blocks of N, unused are skipped (default 1)')
+        common.add_argument('--progress', type=float, default=60, metavar='SEC',
+                            help='log progress and stage latency every SEC seconds (default 60)')
+        common.add_argument('--profile', metavar='FILE',
+                            help='profile workers and save merged pstats to FILE')
+        common.add_argument('--profile-top', type=int, default=30, metavar='N',
+                            help='log top N functions of profile (default 30)')
+        common.add_argument('--metrics-file', metavar='FILE',
+                            help='write metrics as JSON or Prometheus textfile (*.prom)')
+        common.add_argument('--json', default='auto', choices=['auto'] + JSON_BACKENDS,
+                            help='JSON library (default auto - fastest available, -v to log its throughput)')
+        common.add_argument('--cjson', action='store_const', const='cjson', dest='json',
+                            help='same as --json cjson')
+        common.add_argument('--checkpoint', metavar='FILE',
+                            help='periodically save processed position to a file')
+        common.add_argument('--resume', action='store_true', default=False,
+                            help='continue from position saved in --checkpoint file')
         common.add_argument('--write', action='store_true',
                             help='save changes to couch database (default no)')
 
-        for key in self.ALLOW_PATCHES:
-            cmd = self.commands[key]
-            cmd.parser = subparsers.add_parser(key, help=cmd.help, parents=[common], epilog=epilog)
+        # only selected command is imported and adds own arguments
+        selected = self.selected_command(argv)
+        for key in sorted(self.commands):
+            spec, help = self.commands[key]
+            if key != selected:
+                subparsers.add_parser(key, help=help, parents=[common], epilog=epilog)
+                continue
+            cmd = load_command(spec)
+            cmd.parser = subparsers.add_parser(key, help=help or cmd.help, parents=[common], epilog=epilog)
             group = cmd.parser.add_argument_group('{} arguments'.format(key))
             cmd.add_arguments(group)
+            self.patch_class = cmd
 
         if '--help-type' in argv:
             print parser.prog, "allowed --type", self.ALLOW_DOCTYPE
@@ -106,12 +215,66 @@ class PatchApp(object):
             print parser.prog, "error: unknown --type", self.args.doc_type, "allowed", self.ALLOW_DOCTYPE
             sys.exit(1)
 
-        if self.args.concurrency and self.args.processes:
-            print parser.prog, "error: both --concurrency and --processes not allowed, choose one"
+        if not self.args.config and not self.args.input:
+            print parser.prog, "error: -c/--config is required"
+            sys.exit(1)
+
+        if self.args.input:
+            for name in ('changes', 'follow', 'views', 'prefilter', 'selector', 'cache'):
+                if getattr(self.args, name):
+                    print parser.prog, "error: --{} not allowed with --input".format(name)
+                    sys.exit(1)
+
+        if self.args.output and self.args.write:
+            print parser.prog, "error: --write not allowed with --output, documents are saved only to file"
+            sys.exit(1)
+
+        if self.args.follow:
+            if not self.args.checkpoint:
+                print parser.prog, "error: --follow requires --checkpoint to store last seq"
+                sys.exit(1)
+            self.args.changes = True
+            self.args.resume = True
+
+        if self.args.resume and not self.args.checkpoint:
+            print parser.prog, "error: --resume requires --checkpoint"
+            sys.exit(1)
+
+        if sum([1 for n in (self.args.changes, self.args.views, self.args.prefilter, self.args.selector) if n]) > 1:
+            print parser.prog, "error: --changes, --views, --prefilter and --selector not allowed together, choose one"
+            sys.exit(1)
+
+        if self.args.selector:
+            import json
+            try:
+                self.args.selector = json.loads(self.args.selector)
+            except ValueError as e:
+                print parser.prog, "error: --selector is not valid JSON:", e
+                sys.exit(1)
+            if not isinstance(self.args.selector, dict):
+                print parser.prog, "error: --selector must be JSON object"
+                sys.exit(1)
+            if 'doc_type' not in self.args.selector:
+                doc_type = self.args.doc_type
+                self.args.selector['doc_type'] = doc_type[0] if len(doc_type) == 1 else {'$in': doc_type}
+
+        if self.args.check_every < 1:
+            print parser.prog, "error: --check-every must be positive"
+            sys.exit(1)
+
+        if self.args.id_block < 1:
+            print parser.prog, "error: --id-block must be positive"
+            sys.exit(1)
+
+        if self.args.batch_size < 1:
+            print parser.prog, "error: --batch-size must be positive"
             sys.exit(1)
 
-        patch_class = self.commands.get(self.args.patch_name)
-        self.patch = patch_class()
+        if sum([1 for n in (self.args.concurrency, self.args.processes, self.args.async_requests) if n]) > 1:
+            print parser.prog, "error: --concurrency, --processes and --async not allowed together, choose one"
+            sys.exit(1)
+
+        self.patch = self.patch_class()
         try:
             self.patch.check_arguments(self.args)
         except Exception as e:
@@ -119,58 +282,112 @@ class PatchApp(object):
             print self.patch.parser.prog, "error:", e
             sys.exit(1)
 
-    def load_commands(self):
-        self.commands = {}
-        for command in self.ALLOW_PATCHES:
-            name = "openprocurement.patchdb.commands.{}".format(command)
-            module = importlib.import_module(name)
-            self.commands[command] = module.Command
+    @staticmethod
+    def selected_command(argv):
+        for arg in argv[1:]:
+            if not arg.startswith('-'):
+                return arg
 
-    def safe_inc(self, attr):
+    def load_commands(self, argv):
+        self.commands = dict(COMMANDS)
+        self.patch_class = None
+        if self.selected_command(argv) not in self.commands:
+            for key, value in plugin_commands().items():
+                self.commands.setdefault(key, value)
+
+    def safe_inc(self, attr, value=1):
         if self.lock:
             with self.lock:
-                setattr(self, attr, getattr(self, attr, 0) + 1)
+                setattr(self, attr, getattr(self, attr, 0) + value)
         else:
-            setattr(self, attr, getattr(self, attr, 0) + 1)
+            setattr(self, attr, getattr(self, attr, 0) + value)
+        if attr == 'changed' and self.shared_changed:
+            with self.shared_changed.get_lock():
+                self.shared_changed.value += value
+
+    def limit_reached(self):
+        if self.args.limit <= 0:
+            return False
+        if self.shared_changed:
+            return self.shared_changed.value >= self.args.limit
+        return self.changed >= self.args.limit
 
     def create_tender(self, tender):
         if '_rev' in tender:
             raise ValueError('Cant create tender with _rev')
+        if self.db is None:
+            raise ValueError('Cant create tender with --input, tenderID counter requires database')
         old_id = tender.get('_id', '-')
         old_tenderID = tender.get('tenderID', '-')
         tender['_id'] = generate_id()
-        tender['tenderID'] = generate_tender_id(tender['tenderID'], self.db, self.server_id, write=self.args.write)
+        self.mark_written(tender['_id'])
+        tender['tenderID'] = self.tender_ids.allocate(tender['tenderID'], self.db)
         if old_id:
             LOG.info('Clone {} {} to {} {}'.format(old_id, old_tenderID, tender['_id'], tender['tenderID']))
         else:
             LOG.info('Create {} {}'.format(tender['_id'], tender['tenderID']))
         self.safe_inc('created')
-        if not self.args.write:
+        if not self.args.write and not self.output:
             LOG.info('Not saved')
             return False
-        return self.save_with_retry(tender)
+        result = self.save_with_retry(tender)
+        if self.pool and not self.in_repatch():
+            # bound saves in flight, clones are produced faster than saved
+            self.pool.throttle()
+        return result
+
+    def mark_written(self, docid):
+        if self.written_queue:
+            # tell feeder in parent process to skip this id
+            self.written_queue.put(docid)
+        else:
+            self.written_ids.add(docid)
 
-    @with_retry(tries=3, raise_on=ResourceConflict)
     def save_with_retry(self, new):
-        doc_id, doc_rev = self.db.save(new)
+        if self.output:
+            self.output.add(new)
+            return True
+        if self.args.changes:
+            # saved document comes again at the end of changes feed
+            self.mark_written(new['_id'])
+        if self.in_repatch():
+            return self.save_one_with_retry(new)
+        if self.writer:
+            self.writer.add(new)
+            return True
+        if self.pool:
+            self.pool.submit(self.save_one_with_retry, new)
+            return True
+        return self.save_one_with_retry(new)
+
+    def save_one_with_retry(self, new):
+        from couchdb.http import ResourceConflict
+        return with_retry(tries=3, raise_on=ResourceConflict)(self.save_one)(new)
+
+    def save_one(self, new):
+        with self.stats.timer('save'):
+            doc_id, doc_rev = self.db.save(new)
         LOG.info("Saved {} rev {}".format(doc_id, doc_rev))
         self.safe_inc('saved')
         return True
 
     def save_tender(self, tender, old, new):
-        patch = get_revision_changes(new, old)
+        new = unwrap(new)
+        with self.stats.timer('diff'):
+            patch = get_revision_changes(new, old)
         if not patch:
             LOG.info('{} {} no changes made'.format(tender.id, tender.tenderID))
             return
-        new['revisions'].append({
+        # revisions list may be shared with old document
+        new['revisions'] = list(old.get('revisions', [])) + [{
             'author': 'patchdb/{}'.format(self.patch_label),
             'changes': patch,
             'date': get_now().isoformat(),
-            'rev': tender.rev})
+            'rev': tender.rev}]
         doc_type = new.get('doc_type')
         LOG.info('{} {} {} changes {}'.format(doc_type, tender.id, tender.tenderID, patch))
         self.safe_inc('changed')
-        if not self.args.write:
+        if not self.args.write and not self.output:
             LOG.info('Not saved')
             return False
         if self.args.dateModified:
@@ -188,15 +405,94 @@ class PatchApp(object):
         if check_write and not self.args.write:
             LOG.debug("Not checked {}".format(tender.id))
             return
+        if not check_write and not self.check_sampled():
+            LOG.debug("Not checked {} by --check-every".format(tender.id))
+            return
         url = "{}/{}".format(self.api_url, tender.id)
-        get_with_retry(url, check_text)
+        if check_write and self.args.defer_check:
+            with self.check_lock:
+                self.deferred_checks.append((url, check_text))
+            return
+        sync = self.in_repatch()
+        if check_write and self.writer and not sync:
+            self.writer.flush()
+        if check_write and self.pool and not sync:
+            self.pool.wait()
+        if self.verifier:
+            self.verifier.submit(url, check_text)
+            return
+        if self.pool:
+            self.pool.submit(self.check_url, url, check_text)
+            return
+        self.check_url(url, check_text)
+
+    def check_sampled(self):
+        # every Nth patched document, cloned (written) ones are always checked
+        with self.check_lock:
+            self.check_seen += 1
+            return (self.check_seen - 1) % self.args.check_every == 0
+
+    def check_url(self, url, check_text):
+        with self.stats.timer('check'):
+            get_with_retry(url, check_text)
         LOG.debug("Check OK, found {}".format(check_text))
 
+    def run_deferred_checks(self):
+        # submit checks only after their documents are saved
+        if not self.deferred_checks:
+            return
+        if self.writer:
+            self.writer.flush()
+        if self.pool:
+            self.pool.wait()
+        with self.check_lock:
+            checks, self.deferred_checks = self.deferred_checks, list()
+        for url, check_text in checks:
+            if self.verifier:
+                self.verifier.submit(url, check_text)
+            else:
+                self.check_url(url, check_text)
+
+    def close_verifier(self, cancel=False):
+        if self.verifier and not self.verifier.close(cancel):
+            self.has_error = True
+
+    def patch_tender(self, docid, doc=None):
+        if doc is not None:
+            try:
+                return self.patch_document(docid, doc)
+            except (SystemExit, KeyboardInterrupt):
+                raise
+            except Exception as e:
+                LOG.error("patch_tender {} {}".format(type(e).__name__, e))
+                if self.db is None:
+                    raise
+        return self.patch_tender_retry(docid)
+
     @with_retry(tries=3)
-    def patch_tender(self, docid):
-        args = self.args
+    def patch_tender_retry(self, docid):
+        with self.stats.timer('fetch'):
+            doc = self.db.get(docid)
+        return self.patch_document(docid, doc)
+
+    def repatch_tender(self, docid):
+        # document was changed by someone else while waiting in bulk buffer,
+        # rollback counters and apply patch to the fresh revision
+        # runs in bulk writer flush, maybe on pool worker, so saves and checks
+        # go synchronously and never wait for writer buffer or pool
+        self.safe_inc('changed', -1)
+        self.safe_inc('patched', -1)
+        self.local.repatch = True
+        try:
+            return self.patch_tender_retry(docid)
+        finally:
+            self.local.repatch = False
 
-        doc = self.db.get(docid)
+    def in_repatch(self):
+        return getattr(self.local, 'repatch', False)
+
+    def patch_document(self, docid, doc):
+        args = self.args
 
         if self.has_error:
             return
@@ -213,25 +509,27 @@ class PatchApp(object):
             LOG.debug("Ignore {} by doc_type {}".format(docid, doc_type))
             return
 
+        start = time.time()
         if doc_type == 'Tender':
-            tender = Tender().import_data(doc, partial=True)
+            tender = TenderView(doc)
             if not tender.tenderID:
                 raise ValueError("Bad tenderID {}".format(docid))
         elif doc_type == 'Plan':
-            tender = Plan().import_data(doc, partial=True)
+            tender = PlanView(doc)
             if not tender.planID:
                 raise ValueError("Bad planID {}".format(docid))
         elif doc_type == 'Contract':
-            tender = Contract().import_data(doc, partial=True)
+            tender = ContractView(doc)
             if not tender.tender_id:
                 raise ValueError("Bad contract.tender_id {}".format(docid))
         elif doc_type == 'Auction':
-            tender = Auction().import_data(doc, partial=True)
+            tender = AuctionView(doc)
             if not tender.auctionID:
                 raise ValueError("Bad auctionID {}".format(docid))
         else:
             LOG.debug("Ignore {} by doc_type {}".format(docid, doc_type))
             return
+        self.stats.add('import', time.time() - start)
         if args.after and tender.tenderID < args.after:
             LOG.debug("Ignore {} by tenderID {}".format(docid, tender.tenderID))
             return
@@ -256,118 +554,581 @@ class PatchApp(object):
 
         LOG.debug("{} {} {} {} {}".format(doc_type, docid, tender.tenderID, tender.dateModified, tender.status))
 
-        self.patch.patch_tender(self, tender, doc)
+        with self.stats.timer('patch'):
+            self.patch.patch_tender(self, tender, doc)
 
         self.safe_inc('patched')
 
+    def use_json(self):
+        from couchdb import json
+        decode, encode = self.json_codec
+        self.json_decode = self.stats.count_bytes(decode)
+        json.use(decode=self.json_decode, encode=encode)
+
     def open_db(self):
-        self.server = Server(self.db_url, session=Session(retry_delays=range(10)))
+        if self.args.input:
+            return
+        from couchdb import Server, Session
+        from .limiter import LimitedSession
+        if self.limiter:
+            session = LimitedSession(self.limiter, retry_delays=range(10))
+        else:
+            session = Session(retry_delays=range(10))
+        self.server = Server(self.db_url, session=session)
         self.db = self.server[self.db_name]
 
     def init_app(self):
-        config = ConfigParser()
-        config.read(self.args.config)
-        settings = dict(config.items(self.args.section))
+        settings = dict()
+        if self.args.config:
+            config = ConfigParser()
+            config.read(self.args.config)
+            settings = dict(config.items(self.args.section))
         self.db_name = settings.get('couchdb.db_name')
         self.db_url = settings.get('couchdb.url')
         self.server_id = settings.get('id', '1')
+        self.tender_ids = TenderIDAllocator(self.server_id, self.args.write, self.args.id_block)
+
+        name, decode, encode = select_json_backend(self.args.json)
+        self.json_codec = (decode, encode)
+        self.use_json()
+        if self.args.verbose_count:
+            # benchmark takes 0.2s, don't slow down every startup
+            LOG.info("JSON backend {} decode {:.1f} MB/s encode {:.1f} MB/s".format(
+                     name, *benchmark_json(decode, encode, json_sample())))
+        else:
+            LOG.info("JSON backend {}".format(name))
+
+        if self.args.profile:
+            LOG.info("Enable profiler, save to {}".format(self.args.profile))
+            self.profiler = Profiler(self.args.profile, self.args.profile_top)
+            self.profiler.profile_threads()
+
+        if self.args.cache:
+            LOG.info("Enable documents cache {}".format(self.args.cache))
+            self.cache = DocCache(self.args.cache, decode, encode)
+
+        if self.args.max_rate > 0 or self.args.target_latency > 0:
+            from .limiter import RateLimiter
+            LOG.info("Enable adaptive rate limit max {} rps target p95 {} ms".format(
+                     self.args.max_rate or 'unlimited', self.args.target_latency or '-'))
+            self.limiter = RateLimiter(self.args.max_rate, self.args.target_latency / 1000.0)
+            # API is other server, its checks are limited by own rate
+            set_api_limiter(RateLimiter(self.args.max_rate, self.args.target_latency / 1000.0))
+
         self.open_db()
 
-        if self.args.cjson:
-            LOG.info("Enable cjson library")
-            from couchdb import json
-            json.use('cjson')
+        if self.args.async_requests > 1:
+            LOG.info("Enable {} async requests".format(self.args.async_requests))
+            set_pool_size(self.args.async_requests)
+            self.pool = RequestPool(self.args.async_requests)
+            self.lock = threading.Lock()
+
+        from .writer import BulkWriter, FileWriter
+        if self.args.write and self.args.bulk_size > 1:
+            LOG.info("Enable bulk save by {} docs".format(self.args.bulk_size))
+            self.writer = BulkWriter(self, self.args.bulk_size, self.args.bulk_delay, self.pool)
+
+        if self.args.output:
+            LOG.info("Save documents to {}".format(self.args.output))
+            self.output = FileWriter(self, self.args.output)
+            if not self.args.resume:
+                self.output.truncate()
 
         # init api client
         self.api_url = self.args.api_url
+        if self.args.input and self.api_url != 'disable':
+            LOG.info("Disable API checks for --input")
+            self.api_url = 'disable'
         if self.api_url != 'disable':
             if '://' not in self.api_url:
                 self.api_url = 'http://' + self.api_url
             if '/api/' not in self.api_url:
                 self.api_url += '/api/2.3/tenders'
             get_with_retry(self.api_url, 'data')
+            if self.args.check_concurrency > 0:
+                self.verifier = Verifier(self, self.args.check_concurrency)
 
-        # init docs list
-        if self.args.docid:
+        # init docs source
+        if self.args.input:
+            LOG.info("Process documents from {}".format(self.args.input))
+        elif self.args.docid:
             LOG.info("Process {} documents".format(len(self.args.docid)))
-            self.docs_list = self.args.docid
+            self.expected_total = len(self.args.docid)
         elif self.args.changes:
-            LOG.info("Process all documents by changes feed")
-            self.docs_list = self.db_changes()
+            update_seq = self.db.info().get('update_seq')
+            if not self.args.follow and isinstance(update_seq, (int, long)):
+                self.source_end = update_seq
+                LOG.info("Process all documents by changes feed up to seq {}".format(self.source_end))
+            else:
+                LOG.info("Process all documents by changes feed")
+        elif self.args.views and sync_design_doc(self.db, self.args.sync_views):
+            name, ranges, self.expected_total = narrowest_ranges(self.db, self.args)
+            self.view_ranges = (name, ranges)
+            LOG.info("Process documents by view {}".format(name))
+        elif self.args.selector:
+            self.mango_index = sync_mango_index(self.db, self.args.selector, self.args.sync_views)
+            LOG.info("Process documents by selector {}".format(self.args.selector))
+        elif self.args.prefilter and sync_design_doc(self.db, self.args.sync_views, PROJECTION_DOC):
+            self.view_ranges = (PROJECTION_VIEW, filter_ranges(self.args)['by_tenderID'])
+            self.row_filter = self.prefilter_row
+            LOG.info("Process documents prefiltered by view {}".format(PROJECTION_VIEW))
         else:
+            if self.args.views or self.args.prefilter:
+                LOG.warning("Views are not available, fall back to all documents")
             LOG.info("Process all documents")
-            self.docs_list = self.db_all_docs()
+            self.expected_total = self.db.info().get('doc_count')
+            rows = list(self.db.view('_all_docs', descending=True, limit=1))
+            self.source_end = rows[0]['id'] if rows else None
+
+        if self.args.checkpoint:
+            self.checkpoint = Checkpoint(self.args.checkpoint, self.source_name())
+            if self.args.resume:
+                self.resume_pos = self.checkpoint.load(self.args.patch_name)
+
+    def source_name(self):
+        if self.args.input:
+            return 'input'
+        elif self.args.docid:
+            return 'docid'
+        elif self.args.changes:
+            return 'changes'
+        elif self.args.selector:
+            return 'selector'
+        elif self.view_ranges:
+            return self.view_ranges[0]
+        return '_all_docs'
+
+    def docs_source(self, include_docs=False):
+        return self.skip_written(self.open_source(include_docs))
+
+    def skip_written(self, source):
+        # streaming sources return documents saved by this run once again,
+        # don't patch them twice
+        for item in source:
+            if self.written_queue:
+                self.drain_written(self.written_queue)
+            if item and item[0] in self.written_ids:
+                self.written_ids.discard(item[0])
+                continue
+            yield item
+
+    def open_source(self, include_docs=False):
+        pos = self.resume_pos or {}
+        if self.args.input:
+            return self.iter_input(pos.get('line', -1) + 1)
+        elif self.args.docid:
+            return self.iter_docid(pos.get('index', -1) + 1)
+        elif self.args.changes:
+            return self.iter_changes(since=pos.get('since', 0), follow=self.args.follow, until=self.source_end)
+        elif self.args.selector:
+            return self.iter_selector(include_docs, pos)
+        elif self.view_ranges:
+            return self.iter_view_ranges(include_docs, pos)
+        limit = self.args.batch_size if include_docs else 10000
+        if self.source_end is None:
+            return iter(())
+        # stop at last id seen on start, new documents are not processed
+        return self.iter_all_docs('_all_docs', limit, include_docs, startpos=pos, endkey=self.source_end)
+
+    def iter_input(self, start=0):
+        docid_filter = set(self.args.docid or [])
+        fp = open_dump(self.args.input)
+        try:
+            for lineno, doc in iter_dump(fp, self.json_decode, start):
+                self.source_pos = {'line': lineno}
+                if docid_filter and doc.get('_id') not in docid_filter:
+                    continue
+                yield doc.get('_id'), doc
+        finally:
+            fp.close()
+
+    def iter_docid(self, start=0):
+        for index in range(start, len(self.args.docid)):
+            self.source_pos = {'index': index}
+            yield self.args.docid[index], None
+
+    def prefilter_row(self, item):
+        # same filters as patch_document applied to view projection
+        args = self.args
+        tenderID, status, method_type, doc_type, dateModified = item['value']
+        if (args.after and tenderID < args.after or args.before and tenderID > args.before or
+                args.tenderID and tenderID not in args.tenderID or
+                args.status and status not in args.status or
+                args.ignore_id and item['id'] in args.ignore_id or
+                args.method_type and method_type not in args.method_type):
+            self.prefiltered += 1
+            return False
+        return True
 
-    def db_all_docs(self, name='_all_docs', limit=10000, options={}):
+    def iter_all_docs(self, name='_all_docs', limit=10000, include_docs=False, startpos=None, **options):
         options['limit'] = limit + 1
-        docs_list = list()
+        if include_docs:
+            options['include_docs'] = True
+        skip_docid = None
+        if startpos:
+            options['startkey'] = startpos['key']
+            options['startkey_docid'] = skip_docid = startpos['docid']
         while True:
-            count = 0
-            for item in self.db.view(name, **options):
-                if count < limit:
-                    docs_list.append(item['id'])
-                count += 1
-            LOG.info("Preload {} doc.ids, last {}".format(len(docs_list), item.id))
-            if count <= limit:
+            with self.stats.timer('source'):
+                rows = list(self.db.view(name, **options))
+            for item in rows[:limit]:
+                if skip_docid and item['id'] == skip_docid:
+                    continue
+                self.source_pos = {'key': item['key'], 'docid': item['id']}
+                if self.row_filter and not self.row_filter(item):
+                    continue
+                yield item['id'], item.get('doc')
+            skip_docid = None
+            if len(rows) <= limit:
                 break
+            item = rows[-1]
+            LOG.debug("Read {} rows, next {}".format(limit, item['id']))
             options['startkey'] = item['key']
             options['startkey_docid'] = item['id']
-        return docs_list
 
-    def db_changes(self, since=0, limit=10000):
-        docs_list = list()
+    def iter_view_ranges(self, include_docs=False, startpos=None):
+        name, ranges = self.view_ranges
+        limit = self.args.batch_size if include_docs and not self.row_filter else 10000
+        include_docs = include_docs and not self.row_filter
+        start = startpos.get('range', 0) if startpos else 0
+        for index in range(start, len(ranges)):
+            startkey, endkey = ranges[index]
+            pos = startpos if index == start else None
+            for item in self.iter_all_docs(name, limit, include_docs, startpos=pos, reduce=False,
+                                           startkey=startkey, endkey=endkey):
+                self.source_pos['range'] = index
+                yield item
+
+    def iter_selector(self, include_docs=False, startpos=None):
+        limit = self.args.batch_size if include_docs else 10000
+        query = {'selector': self.args.selector, 'limit': limit}
+        if self.mango_index:
+            query['use_index'] = self.mango_index
+        if not include_docs:
+            query['fields'] = ['_id']
+        bookmark, skip = None, -1
+        if startpos:
+            bookmark, skip = startpos.get('bookmark'), startpos.get('index', -1)
         while True:
-            changes = self.db.changes(since=since, limit=limit)
-            since = changes['last_seq']
-            if not changes['results']:
+            if bookmark:
+                query['bookmark'] = bookmark
+            with self.stats.timer('source'):
+                status, headers, data = self.db.resource.post_json('_find', body=query)
+            if data.get('warning') and not bookmark:
+                LOG.warning("Mango: {}".format(data['warning']))
+            for index, doc in enumerate(data['docs']):
+                if index <= skip:
+                    continue
+                # bookmark points to begin of page, resume skips processed
+                self.source_pos = {'bookmark': bookmark, 'index': index}
+                yield doc['_id'], (doc if include_docs else None)
+            skip = -1
+            if len(data['docs']) < limit or not data.get('bookmark'):
                 break
+            bookmark = data['bookmark']
+            LOG.debug("Read {} docs, bookmark {}".format(limit, bookmark))
+
+    def iter_changes(self, since=0, limit=10000, follow=False, until=None):
+        # until is integer update_seq of CouchDB 1.x, sequences of 2.x are not
+        # ordered across shards, so feed is read to the end
+        options = {'feed': 'longpoll', 'timeout': 60000} if follow else {}
+        while not self.feed_stop.is_set():
+            with self.stats.timer('source'):
+                changes = self.db.changes(since=since, limit=limit, **options)
+            since = changes['last_seq']
             for item in changes['results']:
-                docs_list.append(item['id'])
-            LOG.info("Preload {} doc.ids, last_seq {}".format(len(docs_list), since))
-        return docs_list
+                if until is not None and item['seq'] > until:
+                    LOG.debug("Stop on seq {} after start seq {}".format(item['seq'], until))
+                    return
+                self.source_pos = {'since': item['seq']}
+                yield item['id'], None
+            LOG.debug("Read {} changes, last_seq {}".format(len(changes['results']), since))
+            if follow:
+                # close partial batch while waiting for new changes
+                yield None
+            elif not changes['results']:
+                break
+
+    def bulk_get(self, docs_ids):
+        docs = dict()
+        for item in self.db.view('_all_docs', keys=docs_ids, include_docs=True):
+            if item.get('doc'):
+                docs[item['id']] = item['doc']
+        return [(docid, docs.get(docid)) for docid in docs_ids]
+
+    def cached_get(self, docs_ids):
+        # validate cache by current revs, then fetch only changed documents
+        revs = dict()
+        for item in self.db.view('_all_docs', keys=docs_ids):
+            value = item.get('value')
+            if value and not value.get('deleted'):
+                revs[item['id']] = value['rev']
+        docs = self.cache.get_many(revs)
+        missed = [docid for docid in docs_ids if docid in revs and docid not in docs]
+        if missed:
+            fetched = [(docid, doc) for docid, doc in self.bulk_get(missed) if doc]
+            self.cache.put_many([doc for docid, doc in fetched])
+            docs.update(fetched)
+        return docs
+
+    def fetch_batch(self, batch):
+        docs_ids = [docid for docid, doc in batch if doc is None]
+        if not docs_ids:
+            return batch
+        with self.stats.timer('fetch'):
+            if self.cache:
+                docs = self.cached_get(docs_ids)
+            else:
+                docs = dict(self.bulk_get(docs_ids))
+        return batch.copy([(docid, docs.get(docid) if doc is None else doc) for docid, doc in batch])
+
+    def close_batch(self, batch):
+        batch.seq = self.batch_seq
+        batch.pos = self.source_pos
+        self.batch_seq += 1
+        if self.checkpoint:
+            self.checkpoint.add(batch.seq, batch.pos)
+        return batch
+
+    def iter_batches(self, docs_iter):
+        batch = Batch()
+        for item in docs_iter:
+            if item is None:
+                if batch:
+                    yield self.close_batch(batch)
+                    batch = Batch()
+                continue
+            batch.append(item)
+            if len(batch) >= self.args.batch_size:
+                yield self.close_batch(batch)
+                batch = Batch()
+        if batch:
+            yield self.close_batch(batch)
+
+    def fetch_batches(self, batches):
+        if self.pool:
+            return self.pool.imap(self.fetch_batch, batches)
+        return (self.fetch_batch(batch) for batch in batches)
+
+    def batch_done(self, batch):
+        if not self.checkpoint:
+            return
+        self.done_batches.append(batch.seq)
+        if self.args.follow or time.time() - self.commit_time >= self.checkpoint.interval:
+            self.commit_batches()
+
+    def commit_batches(self):
+        # report batches as done only after their documents are saved
+        if not self.checkpoint:
+            return
+        with self.commit_lock:
+            self.commit_time = time.time()
+            done = self.done_batches[:]
+            if self.writer:
+                self.writer.flush()
+                self.writer.wait()
+            if self.pool:
+                self.pool.wait()
+            if self.has_error:
+                # documents of failed flush are not saved, don't mark them done
+                return
+            del self.done_batches[:len(done)]
+            for seq in done:
+                if self.done_queue:
+                    self.done_queue.put(seq)
+                else:
+                    self.checkpoint.done(seq)
+            if self.shared_stat:
+                self.update_stat(self.shared_stat, self.stat_index)
+            if not self.done_queue:
+                self.save_checkpoint(force=self.args.follow)
+
+    def drain_done(self, done_queue, shared_stat, size):
+        if not self.checkpoint:
+            return
+        drained = 0
+        while True:
+            try:
+                seq = done_queue.get_nowait()
+            except Queue.Empty:
+                break
+            self.checkpoint.done(seq)
+            drained += 1
+        self.update_stat(shared_stat, size=size)
+        self.save_checkpoint(force=self.args.follow and drained > 0)
+
+    def save_checkpoint(self, force=False):
+        if self.checkpoint:
+            stat = dict((attr, getattr(self, attr)) for attr in self.STAT)
+            self.checkpoint.save(self.args.patch_name, stat, force)
 
-    def patch_thread(self, modulus, remainder):
+    def queue_put(self, queue, item):
+        while not self.feed_stop.is_set() and not self.has_error and not self.limit_reached():
+            try:
+                queue.put(item, timeout=0.1)
+                return True
+            except Queue.Full:
+                pass
+        return False
+
+    def feed_queue(self, queue, workers):
         try:
-            self.patch_all(modulus, remainder)
+            for batch in self.iter_batches(self.docs_source()):
+                if not self.queue_put(queue, batch):
+                    return
+            for n in range(workers):
+                if not self.queue_put(queue, None):
+                    return
+        except Exception as e:
+            LOG.exception("feed_queue {} {}".format(type(e).__name__, e))
+            self.has_error = True
+
+    def iter_queue(self, queue):
+        while not self.has_error and not self.limit_reached():
+            try:
+                batch = queue.get(timeout=0.1)
+            except Queue.Empty:
+                continue
+            if batch is None:
+                break
+            yield batch
+
+    @contextmanager
+    def profiled(self, name):
+        if not self.profiler:
+            yield
+            return
+        with self.profiler.profile(name):
+            yield
+
+    def merge_profile(self):
+        if self.profiler:
+            self.profiler.merge()
+
+    def patch_thread(self, queue):
+        try:
+            with self.profiled(threading.current_thread().name):
+                self.patch_all(queue)
         except Exception:
             self.has_error = True
             raise
 
-    def patch_process(self, modulus, remainder, shared_stat):
+    def patch_process(self, queue, shared_stat, index, done_queue=None, stats_queue=None, written_queue=None):
+        self.shared_stat = shared_stat
+        self.stat_index = index
+        self.done_queue = done_queue
+        self.stats_queue = stats_queue
+        self.written_queue = written_queue
         try:
+            self.use_json()
             self.open_db()
-            self.patch_all(modulus, remainder)
+            with self.profiled(multiprocessing.current_process().name):
+                self.patch_all(queue)
         finally:
+            self.close_verifier(cancel=self.has_error)
+            if self.profiler:
+                # parent merges only part files, dump threads of this process
+                self.profiler.dump_threads(running=True)
+            self.report_progress(force=True)
             self.print_total()
-            self.update_stat(shared_stat, remainder)
+            self.update_stat(shared_stat, index)
         sys.exit(self.has_error)
 
-    def patch_all(self, modulus=None, remainder=None):
+    def patch_batch(self, batch):
+        for docid, doc in batch:
+            if self.has_error:
+                return False
+            if self.limit_reached():
+                LOG.info("Stop after limit {} reached".format(self.args.limit))
+                return False
+
+            self.patch_tender(docid, doc)
+
+            self.safe_inc('total')
+
+            if self.writer:
+                self.writer.flush_expired()
+            if self.pool:
+                self.pool.throttle()
+
+        self.run_deferred_checks()
+        self.batch_done(batch)
+        self.report_progress()
+        return True
+
+    def patch_all(self, queue=None):
         args = self.args
 
-        docs_iter = iter(self.docs_list)
+        if queue:
+            batches = self.iter_queue(queue)
+        else:
+            batches = self.iter_batches(self.docs_source(include_docs=not self.pool and not self.cache))
 
-        for docid in docs_iter:
-            if self.has_error:
-                break
-            if args.limit > 0 and self.changed >= args.limit:
-                LOG.info("Stop after limit {} reached".format(self.changed))
-                break
-            if modulus and hash(docid) % modulus != remainder:
-                continue
+        batches = self.fetch_batches(batches)
+        if not self.pool:
+            batches = prefetch(batches, (args.prefetch + args.batch_size - 1) // args.batch_size)
 
-            self.patch_tender(docid)
+        try:
+            for batch in batches:
+                if not self.patch_batch(batch):
+                    break
+        finally:
+            if self.writer:
+                self.writer.flush()
+            if self.pool:
+                self.pool.close()
+            if not self.has_error:
+                self.run_deferred_checks()
+            self.commit_batches()
 
-            self.safe_inc('total')
+    def report_progress(self, force=False):
+        if not force and (not self.args.progress or time.time() - self.progress_time < self.args.progress):
+            return
+        with self.stats.lock:
+            if not force and time.time() - self.progress_time < self.args.progress:
+                return
+            self.progress_time = time.time()
+        counters = dict((attr, getattr(self, attr)) for attr in self.STAT)
+        if self.args.processes > 1 and not self.stats_queue:
+            counters = dict()  # parent process, counters come from children
+        snapshot = self.stats.snapshot(counters)
+        if self.stats_queue:
+            self.stats_queue.put((self.stat_index, snapshot))
+            return
+        snapshot = merge_snapshots([snapshot] + self.child_stats.values())
+        LOG.info(format_progress(snapshot, self.expected_total))
+        if self.args.metrics_file:
+            write_metrics(self.args.metrics_file, snapshot)
+
+    def drain_stats(self, stats_queue):
+        while True:
+            try:
+                index, snapshot = stats_queue.get_nowait()
+            except Queue.Empty:
+                break
+            self.child_stats[index] = snapshot
+
+    def drain_written(self, written_queue):
+        while True:
+            try:
+                self.written_ids.add(written_queue.get_nowait())
+            except Queue.Empty:
+                break
 
     def print_total(self):
         LOG.info("Patched {} of {} docs {} changed {} saved".format(
                  self.patched, self.total, self.changed, self.saved))
+        if self.prefiltered:
+            LOG.info("Prefilter skipped {} docs".format(self.prefiltered))
+        if self.cache and self.cache.hits + self.cache.misses:
+            LOG.info("Cache {} hits {} misses".format(self.cache.hits, self.cache.misses))
+        if self.writer and getattr(self.writer, 'failed', None):
+            LOG.error("Not saved {}".format(' '.join(self.writer.failed)))
         if self.has_error:
             LOG.error("Exit with error")
 
     def update_stat(self, shared_stat, key=None, size=None):
-        stat = ['total', 'patched', 'changed', 'saved']
+        stat = self.STAT
         if key is None and size:
             for i, attr in enumerate(stat):
                 value = 0
@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+import threading
+from collections import deque
+from multiprocessing.pool import ThreadPool
+
+from .utils import LOG
+
+
+class RequestPool(object):
+    """Keep up to size blocking requests in flight on shared thread pool,
+    pending requests are owned by the thread which created the pool"""
+
+    def __init__(self, size):
+        self.size = size
+        self.pool = ThreadPool(size)
+        self.pending = deque()
+        self.owner = threading.current_thread()
+
+    def is_owner(self):
+        return threading.current_thread() is self.owner
+
+    def imap(self, func, iterable):
+        """Ordered map which never runs more than size calls ahead"""
+        window = deque()
+        for item in iterable:
+            window.append(self.pool.apply_async(func, (item,)))
+            if len(window) >= self.size:
+                yield window.popleft().get()
+        while window:
+            yield window.popleft().get()
+
+    def submit(self, func, *args):
+        if not self.is_owner():
+            # called from pool worker, waiting on queued requests may deadlock
+            return func(*args)
+        self.pending.append(self.pool.apply_async(func, args))
+
+    def collect(self):
+        while self.pending and self.pending[0].ready():
+            self.pending.popleft().get()
+
+    def throttle(self):
+        if not self.is_owner():
+            return
+        self.collect()
+        while len(self.pending) >= self.size:
+            self.pending.popleft().get()
+
+    def wait(self):
+        if not self.is_owner():
+            return
+        while self.pending:
+            self.pending.popleft().get()
+
+    def close(self):
+        try:
+            self.wait()
+        finally:
+            LOG.debug("Close request pool")
+            self.pool.close()
+            self.pool.join()
@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+import os
+import sys
+import pstats
+import cProfile
+import threading
+from StringIO import StringIO
+from contextlib import contextmanager
+
+from .utils import LOG
+
+
+class Profiler(object):
+    """Profile each worker and every thread started after profile_threads
+    (prefetch, request pool, API checkers) to own part file and merge them
+    to one pstats file (readable by snakeviz, flameprof, gprof2dot)"""
+
+    def __init__(self, filename, top=30):
+        self.filename = filename
+        self.top = top
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.threads = list()
+
+    def part_name(self, name):
+        return '{}.{}.{}.part'.format(self.filename, os.getpid(), name)
+
+    def profile_threads(self):
+        threading.setprofile(self.start_thread)
+
+    def start_thread(self, frame, event, arg):
+        # called on first event of new thread, replaced by cProfile
+        sys.setprofile(None)
+        thread = threading.current_thread()
+        prof = cProfile.Profile()
+        self.local.prof = prof
+        with self.lock:
+            self.threads.append((os.getpid(), thread, prof, '{}-{}'.format(thread.name, len(self.threads))))
+        prof.enable()
+
+    def dump_threads(self, running=False):
+        # stats of profiled threads are dumped from other thread after their end
+        with self.lock:
+            threads, self.threads = self.threads, list()
+            for item in threads:
+                pid, thread, prof, name = item
+                if pid != os.getpid():
+                    continue  # inherited from parent process
+                if thread.is_alive() and not running:
+                    self.threads.append(item)
+                    continue
+                prof.dump_stats(self.part_name(name))
+
+    @contextmanager
+    def profile(self, name):
+        if getattr(self.local, 'prof', None):
+            # thread is already profiled from its start
+            yield
+            return
+        prof = cProfile.Profile()
+        prof.enable()
+        try:
+            yield
+        finally:
+            prof.disable()
+            prof.dump_stats(self.part_name(name))
+            self.dump_threads()
+
+    def merge(self):
+        self.dump_threads(running=True)
+        directory = os.path.dirname(self.filename) or '.'
+        prefix = os.path.basename(self.filename) + '.'
+        parts = sorted([os.path.join(directory, part) for part in os.listdir(directory)
+                        if part.startswith(prefix) and part.endswith('.part')])
+        if not parts:
+            return
+        stream = StringIO()
+        stats = pstats.Stats(parts[0], stream=stream)
+        for part in parts[1:]:
+            stats.add(part)
+        stats.dump_stats(self.filename)
+        for part in parts:
+            os.unlink(part)
+        for sort in ('cumulative', 'tottime'):
+            stats.sort_stats(sort).print_stats(self.top)
+        LOG.info("Profile of {} threads saved to {}\n{}".format(len(parts), self.filename, stream.getvalue()))
@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+from datetime import datetime
+from iso8601 import parse_date
+from schematics.models import Model
+from schematics.types import BaseType, StringType
+from schematics.types.compound import DictType, ListType
+
+from .models import TZ, get_now
+
+
+class IsoDateTimeType(BaseType):
+    MESSAGES = {
+        'parse': u'Could not parse {0}. Should be ISO8601.',
+    }
+
+    def to_native(self, value, context=None):
+        if isinstance(value, datetime):
+            return value
+        date = parse_date(value, None)
+        if not date.tzinfo:
+            date = TZ.localize(date)
+        return date
+
+    def to_primitive(self, value, context=None):
+        return value.isoformat()
+
+
+class Revision(Model):
+    author = StringType()
+    date = IsoDateTimeType(default=get_now)
+    changes = ListType(DictType(BaseType), default=list())
+    rev = StringType()
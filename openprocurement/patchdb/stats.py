@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+import os
+import json
+import time
+import threading
+from contextlib import contextmanager
+
+
+STAGES = ['source', 'fetch', 'import', 'patch', 'diff', 'save', 'check']
+BUCKETS = [0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0]
+
+
+class Stats(object):
+    """Per-stage latency histograms and received bytes of one worker,
+    stage data is a list [count, sum, bucket_0, ..., bucket_inf]"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.start_time = time.time()
+        self.bytes = 0
+        self.stages = dict((stage, [0, 0.0] + [0] * (len(BUCKETS) + 1)) for stage in STAGES)
+
+    def add(self, stage, seconds):
+        index = 2
+        for bound in BUCKETS:
+            if seconds <= bound:
+                break
+            index += 1
+        with self.lock:
+            data = self.stages[stage]
+            data[0] += 1
+            data[1] += seconds
+            data[index] += 1
+
+    @contextmanager
+    def timer(self, stage):
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.add(stage, time.time() - start)
+
+    def count_bytes(self, decode):
+        def counting_decode(string):
+            with self.lock:
+                self.bytes += len(string)
+            return decode(string)
+        return counting_decode
+
+    def snapshot(self, counters):
+        with self.lock:
+            return {
+                'elapsed': time.time() - self.start_time,
+                'bytes': self.bytes,
+                'counters': dict(counters),
+                'stages': dict((stage, list(data)) for stage, data in self.stages.items()),
+            }
+
+
+def merge_snapshots(snapshots):
+    merged = {'elapsed': 0, 'bytes': 0, 'counters': {}, 'stages': {}}
+    for snapshot in snapshots:
+        merged['elapsed'] = max(merged['elapsed'], snapshot['elapsed'])
+        merged['bytes'] += snapshot['bytes']
+        for key, value in snapshot['counters'].items():
+            merged['counters'][key] = merged['counters'].get(key, 0) + value
+        for stage, data in snapshot['stages'].items():
+            if stage not in merged['stages']:
+                merged['stages'][stage] = list(data)
+            else:
+                merged['stages'][stage] = [a + b for a, b in zip(merged['stages'][stage], data)]
+    return merged
+
+
+def percentile(data, q):
+    need = data[0] * q
+    total = 0
+    for bound, count in zip(BUCKETS + [float('inf')], data[2:]):
+        total += count
+        if total >= need:
+            return bound
+    return float('inf')
+
+
+def format_ms(seconds):
+    if seconds == float('inf'):
+        return '>{:.0f}s'.format(BUCKETS[-1])
+    return '{:.1f}ms'.format(1000 * seconds)
+
+
+def format_eta(seconds):
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    days, hours = divmod(hours, 24)
+    line = '{:02d}:{:02d}:{:02d}'.format(hours, minutes, seconds)
+    return '{}d {}'.format(days, line) if days else line
+
+
+def format_progress(snapshot, expected=None):
+    total = snapshot['counters'].get('total', 0)
+    elapsed = max(snapshot['elapsed'], 0.001)
+    rate = total / elapsed
+    line = "Progress {} docs {:.1f} docs/s {:.1f} MB".format(total, rate, snapshot['bytes'] / 1048576.0)
+    if expected and rate > 0 and expected > total:
+        line += " ETA {}".format(format_eta((expected - total) / rate))
+    for stage in STAGES:
+        data = snapshot['stages'].get(stage)
+        if not data or not data[0]:
+            continue
+        line += "; {} avg {} p95 {}".format(stage, format_ms(data[1] / data[0]), format_ms(percentile(data, 0.95)))
+    return line
+
+
+def prometheus_text(snapshot):
+    lines = ['patchdb_elapsed_seconds {:.3f}'.format(snapshot['elapsed']),
+             'patchdb_received_bytes {}'.format(snapshot['bytes'])]
+    for key, value in sorted(snapshot['counters'].items()):
+        lines.append('patchdb_docs_{} {}'.format(key, value))
+    for stage, data in sorted(snapshot['stages'].items()):
+        total = 0
+        for bound, count in zip(BUCKETS, data[2:]):
+            total += count
+            lines.append('patchdb_stage_seconds_bucket{{stage="{}",le="{}"}} {}'.format(stage, bound, total))
+        lines.append('patchdb_stage_seconds_bucket{{stage="{}",le="+Inf"}} {}'.format(stage, data[0]))
+        lines.append('patchdb_stage_seconds_sum{{stage="{}"}} {:.6f}'.format(stage, data[1]))
+        lines.append('patchdb_stage_seconds_count{{stage="{}"}} {}'.format(stage, data[0]))
+    return '\n'.join(lines) + '\n'
+
+
+def write_metrics(filename, snapshot):
+    """Write JSON or Prometheus textfile (by .prom extension) atomically"""
+    tmpname = filename + '.tmp'
+    with open(tmpname, 'w') as fp:
+        if filename.endswith('.prom'):
+            fp.write(prometheus_text(snapshot))
+        else:
+            json.dump(snapshot, fp, indent=2, sort_keys=True)
+    os.rename(tmpname, filename)
@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+import os
+import json
+import shutil
+import tempfile
+import unittest
+
+from openprocurement.patchdb.cache import DocCache
+
+
+class DocCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.cache = DocCache(os.path.join(self.tmpdir, 'cache.db'), json.loads, json.dumps)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_get_by_rev(self):
+        self.cache.put_many([{'_id': 'a', '_rev': '1-a', 'title': u'тест'},
+                             {'_id': 'b', '_rev': '1-b'}])
+        found = self.cache.get_many({'a': '1-a', 'b': '1-b', 'c': '1-c'})
+        self.assertEqual(found, {'a': {'_id': 'a', '_rev': '1-a', 'title': u'тест'},
+                                 'b': {'_id': 'b', '_rev': '1-b'}})
+        self.assertEqual((self.cache.hits, self.cache.misses), (2, 1))
+
+    def test_new_rev_invalidates(self):
+        self.cache.put_many([{'_id': 'a', '_rev': '1-a', 'v': 1}])
+        self.assertEqual(self.cache.get_many({'a': '2-a'}), {})
+        self.cache.put_many([{'_id': 'a', '_rev': '2-a', 'v': 2}])
+        self.assertEqual(self.cache.get_many({'a': '1-a'}), {})
+        self.assertEqual(self.cache.get_many({'a': '2-a'}), {'a': {'_id': 'a', '_rev': '2-a', 'v': 2}})
+
+    def test_reopen(self):
+        self.cache.put_many([{'_id': 'a', '_rev': '1-a'}])
+        cache = DocCache(self.cache.filename, json.loads, json.dumps)
+        self.assertEqual(list(cache.get_many({'a': '1-a'})), ['a'])
+
+    def test_many_ids(self):
+        docs = [{'_id': str(n), '_rev': '1-x'} for n in range(1200)]
+        self.cache.put_many(docs)
+        self.assertEqual(len(self.cache.get_many(dict((doc['_id'], '1-x') for doc in docs))), 1200)
@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+import os
+import shutil
+import tempfile
+import unittest
+
+from openprocurement.patchdb.checkpoint import Checkpoint
+
+
+class CheckpointTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.tmpdir, 'checkpoint.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_position_moves_only_over_finished_batches(self):
+        checkpoint = Checkpoint(self.filename, '_all_docs')
+        for seq in range(3):
+            checkpoint.add(seq, {'key': 'k{}'.format(seq), 'docid': 'd{}'.format(seq)})
+        checkpoint.done(1)
+        self.assertIsNone(checkpoint.pos)
+        checkpoint.done(0)
+        self.assertEqual(checkpoint.pos['docid'], 'd1')
+        checkpoint.done(2)
+        self.assertEqual(checkpoint.pos['docid'], 'd2')
+
+    def test_save_and_load(self):
+        checkpoint = Checkpoint(self.filename, 'changes')
+        checkpoint.add(0, {'since': 10})
+        checkpoint.done(0)
+        checkpoint.save('remove_auction_options', {'patched': 1}, force=True)
+        loaded = Checkpoint(self.filename, 'changes')
+        self.assertEqual(loaded.load('remove_auction_options'), {'since': 10})
+
+    def test_load_other_source(self):
+        checkpoint = Checkpoint(self.filename, 'changes')
+        checkpoint.add(0, {'since': 10})
+        checkpoint.done(0)
+        checkpoint.save('remove_auction_options', {}, force=True)
+        with self.assertRaises(ValueError):
+            Checkpoint(self.filename, '_all_docs').load('remove_auction_options')
+        with self.assertRaises(ValueError):
+            Checkpoint(self.filename, 'changes').load('cancel_auction')
+
+    def test_load_missing(self):
+        self.assertIsNone(Checkpoint(self.filename, 'changes').load('cancel_auction'))
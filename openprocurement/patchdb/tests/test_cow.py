@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+import unittest
+from copy import deepcopy
+
+import jsonpatch
+
+from openprocurement.patchdb.cow import CowDict, CowList, unwrap
+
+
+class CowDictTest(unittest.TestCase):
+
+    def setUp(self):
+        self.doc = {
+            'id': 'a',
+            'lots': [{'id': 'l1', 'auctionPeriod': {'startDate': '2017'}}, {'id': 'l2'}],
+            'items': [{'id': 'i1'}],
+        }
+        self.orig = deepcopy(self.doc)
+
+    def test_untouched_returns_original(self):
+        new = CowDict(self.doc)
+        self.assertEqual(new['lots'][0]['id'], 'l1')
+        self.assertIs(new.unwrap(), self.doc)
+
+    def test_nested_change_copies_only_path(self):
+        new = CowDict(self.doc)
+        del new['lots'][0]['auctionPeriod']['startDate']
+        result = unwrap(new)
+        self.assertEqual(self.doc, self.orig)
+        self.assertEqual(result['lots'][0]['auctionPeriod'], {})
+        self.assertIs(result['items'], self.doc['items'])
+        self.assertIs(result['lots'][1], self.doc['lots'][1])
+
+    def test_list_operations(self):
+        new = CowDict(self.doc)
+        lots = new['lots']
+        self.assertIsInstance(lots, CowList)
+        lots.append({'id': 'l3'})
+        del lots[0]
+        lots[0]['title'] = 'x'
+        result = new.unwrap()
+        self.assertEqual([lot['id'] for lot in result['lots']], ['l2', 'l3'])
+        self.assertEqual(result['lots'][0]['title'], 'x')
+        self.assertEqual(self.doc, self.orig)
+
+    def test_changes_revert_to_original(self):
+        new = CowDict(self.doc)
+        new['status'] = 'cancelled'
+        new['lots'][1]['id'] = 'l9'
+        changes = new.changes()
+        self.assertEqual(jsonpatch.apply_patch(deepcopy(new.unwrap()), changes), self.orig)
@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+import os
+import gzip
+import json
+import shutil
+import tempfile
+import unittest
+
+from openprocurement.patchdb.dump import open_dump, iter_dump
+from openprocurement.patchdb.writer import FileWriter
+
+
+class FakeApp(object):
+    saved = 0
+
+    def safe_inc(self, name, value=1):
+        setattr(self, name, getattr(self, name) + value)
+
+
+class DumpTest(unittest.TestCase):
+    docs = [
+        {'_id': 'a', '_rev': '1-a', 'title': u'тендер'},
+        {'_id': 'b', '_rev': '2-b', 'items': [{'id': 1}]},
+    ]
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def read(self, filename, start=0):
+        fp = open_dump(filename)
+        try:
+            return list(iter_dump(fp, json.loads, start))
+        finally:
+            fp.close()
+
+    def test_output_round_trip(self):
+        filename = os.path.join(self.tmpdir, 'out.json')
+        app = FakeApp()
+        writer = FileWriter(app, filename)
+        writer.truncate()
+        for doc in self.docs:
+            writer.add(doc)
+        self.assertEqual(app.saved, 2)
+        self.assertEqual(self.read(filename), list(enumerate(self.docs)))
+        self.assertEqual(self.read(filename, start=1), [(1, self.docs[1])])
+
+    def test_all_docs_dump(self):
+        filename = os.path.join(self.tmpdir, 'all_docs.json.gz')
+        fp = gzip.open(filename, 'wb')
+        fp.write('{"total_rows":2,"offset":0,"rows":[\n')
+        for doc in self.docs:
+            fp.write(json.dumps({'id': doc['_id'], 'key': doc['_id'], 'value': {'rev': doc['_rev']},
+                                 'doc': doc}) + ',\n')
+        fp.write(']}\n')
+        fp.close()
+        self.assertEqual([doc for lineno, doc in self.read(filename)], self.docs)
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+import time
+import unittest
+import multiprocessing
+
+from openprocurement.patchdb.limiter import RateLimiter
+
+
+FAST = (0.001, False)
+ERROR = (0.001, True)
+SLOW = (0.5, False)
+
+
+class RateLimiterTest(unittest.TestCase):
+
+    def feed(self, limiter, samples, elapsed=1.0):
+        # count samples during elapsed seconds, last one adjusts rate
+        limiter.shared[2] = time.time() + 3600
+        for seconds, error in samples:
+            limiter.feedback(seconds, error)
+        limiter.shared[2] = time.time() - elapsed
+        limiter.feedback(0.001)
+
+    def test_start_unlimited(self):
+        limiter = RateLimiter(target_latency=0.1)
+        self.assertEqual(limiter.rate, 0)
+        start = time.time()
+        for n in range(1000):
+            limiter.acquire()
+        self.assertLess(time.time() - start, 0.5)
+
+    def test_start_max_rate(self):
+        self.assertEqual(RateLimiter(max_rate=50).rate, 50)
+
+    def test_backoff_on_errors(self):
+        limiter = RateLimiter(max_rate=100)
+        self.feed(limiter, [ERROR] + [FAST] * 9)
+        self.assertAlmostEqual(limiter.rate, 70)
+        self.feed(limiter, [ERROR] + [FAST] * 9)
+        self.assertAlmostEqual(limiter.rate, 49)
+
+    def test_backoff_unlimited_from_actual_rate(self):
+        limiter = RateLimiter(target_latency=0.1)
+        self.feed(limiter, [ERROR] + [FAST] * 198, elapsed=2.0)
+        self.assertAlmostEqual(limiter.rate, 70, delta=1)
+
+    def test_backoff_on_slow_share(self):
+        limiter = RateLimiter(max_rate=100, target_latency=0.1)
+        self.feed(limiter, [SLOW] * 3 + [FAST] * 97)
+        self.assertEqual(limiter.rate, 100)
+        self.feed(limiter, [SLOW] * 10 + [FAST] * 90)
+        self.assertAlmostEqual(limiter.rate, 70)
+
+    def test_samples_shared_by_processes(self):
+        limiter = RateLimiter(max_rate=100, target_latency=0.1)
+        limiter.shared[2] = time.time() + 3600
+        child = multiprocessing.Process(target=lambda: [limiter.feedback(*SLOW) for n in range(10)])
+        child.start()
+        child.join()
+        self.feed(limiter, [FAST] * 90)
+        self.assertAlmostEqual(limiter.rate, 70)
+
+    def test_min_rate(self):
+        limiter = RateLimiter(max_rate=1.2)
+        self.feed(limiter, [ERROR])
+        self.assertEqual(limiter.rate, 1.0)
+
+    def test_speed_up_to_max_rate(self):
+        limiter = RateLimiter(max_rate=100)
+        limiter.shared[0] = 50
+        self.feed(limiter, [FAST] * 10)
+        self.assertEqual(limiter.rate, 50)
+        self.feed(limiter, [FAST] * 50)
+        self.assertAlmostEqual(limiter.rate, 55)
+        limiter.shared[0] = 99
+        self.feed(limiter, [FAST] * 99)
+        self.assertEqual(limiter.rate, 100)
+
+    def test_acquire_spaces_requests(self):
+        limiter = RateLimiter(max_rate=100)
+        start = time.time()
+        for n in range(11):
+            limiter.acquire()
+        self.assertGreaterEqual(time.time() - start, 0.09)
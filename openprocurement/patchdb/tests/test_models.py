@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+import threading
+import unittest
+
+from openprocurement.patchdb.models import TenderIDAllocator
+
+
+class FakeDB(object):
+    """Counter documents with revision check like CouchDB"""
+
+    def __init__(self, conflicts=0):
+        self.docs = dict()
+        self.saves = 0
+        self.conflicts = conflicts
+        self.lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self.lock:
+            doc = self.docs.get(key)
+            return dict(doc) if doc else default
+
+    def save(self, doc):
+        with self.lock:
+            if self.conflicts:
+                self.conflicts -= 1
+                raise Exception('conflict')
+            current = self.docs.get(doc['_id'])
+            if current and current['_rev'] != doc.get('_rev'):
+                raise Exception('conflict')
+            self.saves += 1
+            doc['_rev'] = str(self.saves)
+            self.docs[doc['_id']] = dict(doc)
+            return doc['_id'], doc['_rev']
+
+
+class TenderIDAllocatorTest(unittest.TestCase):
+
+    def test_one_by_one(self):
+        db = FakeDB()
+        allocator = TenderIDAllocator('a', write=True)
+        self.assertEqual(allocator.allocate('UA-2017-07-12-000293-c', db), 'UA-2017-07-12-000001-a')
+        self.assertEqual(allocator.allocate('UA-2017-07-12-000293-c', db), 'UA-2017-07-12-000002-a')
+        self.assertEqual(db.docs['tenderID_a']['2017-07-12'], 3)
+        self.assertEqual(db.saves, 2)
+
+    def test_block_reserved_by_one_write(self):
+        db = FakeDB()
+        allocator = TenderIDAllocator('a', write=True, block=10)
+        ids = [allocator.allocate('UA-2017-07-12-000293-c', db) for i in range(12)]
+        self.assertEqual(len(set(ids)), 12)
+        self.assertEqual(ids[11], 'UA-2017-07-12-000012-a')
+        self.assertEqual(db.saves, 2)
+        self.assertEqual(db.docs['tenderID_a']['2017-07-12'], 21)
+
+    def test_server_id_from_tenderID(self):
+        db = FakeDB()
+        allocator = TenderIDAllocator(write=True)
+        self.assertEqual(allocator.allocate('UA-2017-07-12-000293-c', db), 'UA-2017-07-12-000001-c')
+        self.assertIn('tenderID_c', db.docs)
+
+    def test_retry_on_conflict(self):
+        db = FakeDB(conflicts=2)
+        allocator = TenderIDAllocator('a', write=True)
+        self.assertEqual(allocator.allocate('UA-2017-07-12-000293-c', db), 'UA-2017-07-12-000001-a')
+
+    def test_pool_dropped_after_fork(self):
+        db = FakeDB()
+        allocator = TenderIDAllocator('a', write=True, block=10)
+        first = allocator.allocate('UA-2017-07-12-000293-c', db)
+        allocator.pid = -1  # as if in forked child
+        second = allocator.allocate('UA-2017-07-12-000293-c', db)
+        self.assertEqual(first, 'UA-2017-07-12-000001-a')
+        self.assertEqual(second, 'UA-2017-07-12-000011-a')
+
+    def test_threads_get_unique_ids(self):
+        db = FakeDB()
+        allocator = TenderIDAllocator('a', write=True, block=3)
+        ids = list()
+
+        def worker():
+            for i in range(50):
+                ids.append(allocator.allocate('UA-2017-07-12-000293-c', db))
+
+        threads = [threading.Thread(target=worker) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(set(ids)), 200)
+
+    def test_bad_tenderID(self):
+        with self.assertRaises(ValueError):
+            TenderIDAllocator('a').allocate('bad', FakeDB())
@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+import os
+import pstats
+import shutil
+import tempfile
+import threading
+import unittest
+
+from openprocurement.patchdb.profiling import Profiler
+
+
+def worker_function():
+    return sum(range(1000))
+
+
+class ProfilerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.tmpdir, 'out.prof')
+
+    def tearDown(self):
+        threading.setprofile(None)
+        shutil.rmtree(self.tmpdir)
+
+    def test_threads_merged(self):
+        profiler = Profiler(self.filename, top=5)
+        profiler.profile_threads()
+        with profiler.profile('MainThread'):
+            thread = threading.Thread(target=worker_function, name='Worker')
+            thread.start()
+            thread.join()
+        profiler.merge()
+        self.assertEqual(os.listdir(self.tmpdir), ['out.prof'])
+        functions = [func for filename, line, func in pstats.Stats(self.filename).stats]
+        self.assertIn('worker_function', functions)
+        self.assertIn('join', functions)
@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+import re
+import random
+import argparse
+import unittest
+from copy import deepcopy
+
+from openprocurement.patchdb.cow import unwrap
+from openprocurement.patchdb.models import TenderView
+from openprocurement.patchdb.commands.replace_documents_url import Command, UrlRewriter
+
+
+def old_replace(search, replace, url):
+    # per document replace before UrlRewriter
+    search = re.compile(search)
+    if search.search(url):
+        return search.sub(replace, url)
+    return url
+
+
+def old_find_and_replace(root, search, replace):
+    if isinstance(root, dict):
+        if set(root.keys()) >= set(['id', 'title', 'format', 'url']):
+            root['url'] = old_replace(search, replace, root['url'])
+        for item in root.values():
+            old_find_and_replace(item, search, replace)
+    elif isinstance(root, list):
+        for item in root:
+            old_find_and_replace(item, search, replace)
+
+
+def make_tender():
+    def document(n, host):
+        return {'id': 'd{}'.format(n), 'title': 't', 'format': 'f', 'url': 'http://{}/get/{}'.format(host, n)}
+    return {
+        'id': 'x', 'title': 'x', 'value': {}, 'auctionUrl': 'http://auction.old/x',
+        'documents': [document(1, 'docs.old'), document(2, 'other')],
+        'awards': [{'documents': [document(3, 'docs.old')], 'complaints': [{'documents': [document(4, 'docs.old')]}]}],
+        'agreements': [{'documents': [document(5, 'docs.old')]}],
+        'milestones': {'nested': [document(6, 'docs.old')]},
+    }
+
+
+class FakePatcher(object):
+    def __init__(self):
+        self.saved = list()
+
+    def save_tender(self, tender, old, new):
+        self.saved.append(unwrap(new))
+
+    def check_tender(self, tender, check_text, check_write=False):
+        pass
+
+
+class UrlRewriterTest(unittest.TestCase):
+
+    def test_single_rule_same_as_old(self):
+        rnd = random.Random(25)
+        hosts = ['docs.old', 'docs.oldX', 'docsXold', 'new.host', 'a.docs.old']
+        rules = [r'http://docs\.old/', r'docs.old', r'http://(\w+)\.old/', r'^http://docs\.old/get/1$']
+        replaces = ['https://docs.new/', 'x.y', r'https://\1.new/', 'http://one']
+        for search, replace in zip(rules, replaces):
+            rewriter = UrlRewriter([(search, replace)])
+            for n in range(200):
+                url = 'http://{}/get/{}'.format(rnd.choice(hosts), rnd.randint(0, 3))
+                self.assertEqual(rewriter.rewrite(url) or url, old_replace(search, replace, url))
+
+    def test_first_rule_wins(self):
+        rewriter = UrlRewriter([(r'http://docs\.old/get/', 'https://a/'), (r'http://docs\.old/', 'https://b/')])
+        self.assertEqual(rewriter.rewrite('http://docs.old/get/1'), 'https://a/1')
+        self.assertEqual(rewriter.rewrite('http://docs.old/x/1'), 'https://b/x/1')
+        self.assertIsNone(rewriter.rewrite('http://other/x/1'))
+
+    def test_leftmost_match_wins(self):
+        rewriter = UrlRewriter([('old', 'OLD'), (r'http://docs\.', 'https://docs.')])
+        self.assertEqual(rewriter.rewrite('http://docs.old/'), 'https://docs.old/')
+
+    def test_prefix_fast_path_respects_regexp_order(self):
+        rewriter = UrlRewriter([(r'http://docs\.ol./', 'https://regexp/'), (r'http://docs\.old/', 'https://literal/')])
+        self.assertEqual(rewriter.rewrite('http://docs.old/1'), 'https://regexp/1')
+
+    def test_memoized(self):
+        rewriter = UrlRewriter([(r'http://docs\.old/', 'https://docs.new/')])
+        self.assertEqual(rewriter.rewrite('http://docs.old/1'), 'https://docs.new/1')
+        self.assertEqual(rewriter.cache, {'http://docs.old/1': 'https://docs.new/1'})
+
+
+class ReplaceDocumentsUrlTest(unittest.TestCase):
+
+    def run_command(self, argv, tender):
+        parser = argparse.ArgumentParser()
+        Command.add_arguments(parser)
+        command = Command()
+        command.check_arguments(parser.parse_args(argv))
+        patcher = FakePatcher()
+        command.patch_tender(patcher, TenderView(tender), tender)
+        return patcher.saved
+
+    def test_same_as_old_recursive_replace(self):
+        tender = make_tender()
+        expected = deepcopy(tender)
+        old_find_and_replace(expected, r'http://docs\.old/', 'https://docs.new/')
+        saved = self.run_command(['--doc-url-search', r'http://docs\.old/',
+                                  '--doc-url-replace', 'https://docs.new/'], tender)
+        self.assertEqual(saved, [expected])
+        self.assertEqual(tender, make_tender())
+
+    def test_known_paths_skip_other_keys(self):
+        saved = self.run_command(['--doc-url-search', r'http://docs\.old/',
+                                  '--doc-url-replace', 'https://docs.new/', '--known-paths'], make_tender())
+        self.assertEqual(saved[0]['awards'][0]['complaints'][0]['documents'][0]['url'], 'https://docs.new/get/4')
+        self.assertEqual(saved[0]['agreements'][0]['documents'][0]['url'], 'http://docs.old/get/5')
+
+    def test_auction_url(self):
+        saved = self.run_command(['--auction-url-search', r'http://auction\.old/',
+                                  '--auction-url-replace', 'https://auction.new/'], make_tender())
+        self.assertEqual(saved[0]['auctionUrl'], 'https://auction.new/x')
+        self.assertEqual(saved[0]['documents'][0]['url'], 'http://docs.old/get/1')
+
+    def test_nothing_changed_not_saved(self):
+        saved = self.run_command(['--doc-url-search', r'http://none/', '--doc-url-replace', 'x'], make_tender())
+        self.assertEqual(saved, [])
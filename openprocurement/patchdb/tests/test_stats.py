@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+import unittest
+
+from openprocurement.patchdb.stats import Stats, format_eta, format_progress, merge_snapshots, percentile
+
+
+class StatsTest(unittest.TestCase):
+
+    def snapshot(self, total, elapsed):
+        stats = Stats()
+        for seconds in [0.002] * 95 + [0.2] * 5:
+            stats.add('fetch', seconds)
+        snapshot = stats.snapshot({'total': total})
+        snapshot['elapsed'] = elapsed
+        return snapshot
+
+    def test_percentile(self):
+        data = self.snapshot(0, 1)['stages']['fetch']
+        self.assertEqual(percentile(data, 0.5), 0.0025)
+        self.assertEqual(percentile(data, 0.95), 0.0025)
+        self.assertEqual(percentile(data, 0.99), 0.25)
+
+    def test_format_eta(self):
+        self.assertEqual(format_eta(59.9), '00:00:59')
+        self.assertEqual(format_eta(3 * 3600 + 62), '03:01:02')
+        self.assertEqual(format_eta(86400 + 3600), '1d 01:00:00')
+        self.assertEqual(format_eta(10 * 86400 + 59), '10d 00:00:59')
+
+    def test_format_progress(self):
+        line = format_progress(self.snapshot(100, 10), expected=1000)
+        self.assertTrue(line.startswith('Progress 100 docs 10.0 docs/s 0.0 MB ETA 00:01:30; fetch avg'), line)
+        self.assertIn('p95 2.5ms', line)
+        self.assertNotIn('save', line)
+
+    def test_format_progress_long_eta(self):
+        line = format_progress(self.snapshot(1000, 100), expected=10 ** 7)
+        self.assertIn(' ETA 11d 13:45:00;', line)
+
+    def test_format_progress_done(self):
+        self.assertNotIn('ETA', format_progress(self.snapshot(100, 10), expected=100))
+
+    def test_merge_snapshots(self):
+        merged = merge_snapshots([self.snapshot(100, 10), self.snapshot(50, 20)])
+        self.assertEqual(merged['counters'], {'total': 150})
+        self.assertEqual(merged['elapsed'], 20)
+        self.assertEqual(merged['stages']['fetch'][0], 200)
@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+import random
+import unittest
+from copy import deepcopy
+
+import jsonpatch
+
+from openprocurement.patchdb.utils import escape_pointer, make_changes, get_revision_changes
+
+
+def random_value(rnd, depth=0):
+    kind = rnd.randint(0, 5 if depth < 3 else 2)
+    if kind == 0:
+        return rnd.randint(0, 3)
+    if kind == 1:
+        return rnd.choice([u'a', u'b', u'т', None, True])
+    if kind == 2:
+        return rnd.choice([u'x/y', u'm~n', u''])
+    if kind == 3:
+        return [random_value(rnd, depth + 1) for i in range(rnd.randint(0, 4))]
+    keys = [u'a', u'b', u'c/d', u'e~f', u'g']
+    return dict((k, random_value(rnd, depth + 1)) for k in rnd.sample(keys, rnd.randint(0, 4)))
+
+
+def mutate(rnd, value, depth=0):
+    if isinstance(value, dict) and value and rnd.random() < 0.8:
+        value = dict(value)
+        key = rnd.choice(sorted(value))
+        action = rnd.randint(0, 2)
+        if action == 0:
+            del value[key]
+        elif action == 1:
+            value[key] = mutate(rnd, value[key], depth + 1)
+        else:
+            value[key + u'/new'] = random_value(rnd, depth + 1)
+        return value
+    if isinstance(value, list) and value and rnd.random() < 0.8:
+        value = list(value)
+        index = rnd.randrange(len(value))
+        action = rnd.randint(0, 3)
+        if action == 0:
+            del value[index]
+        elif action == 1:
+            value[index] = mutate(rnd, value[index], depth + 1)
+        elif action == 2:
+            value.insert(index, random_value(rnd, depth + 1))
+        else:
+            value.append(random_value(rnd, depth + 1))
+        return value
+    return random_value(rnd, depth)
+
+
+class MakeChangesTest(unittest.TestCase):
+
+    def test_escape_pointer(self):
+        self.assertEqual(escape_pointer('a/b~c'), 'a~1b~0c')
+
+    def test_same_patch_as_jsonpatch(self):
+        cases = [
+            ({'a': 1}, {'a': 2}),
+            ({'a': 1}, {'a': True}),
+            ({'a': 0}, {'a': False}),
+            ({'a': 1}, {'a': 1.0}),
+            ({'a': 1.0}, {'a': 1}),
+            ({'a': None}, {'a': 0}),
+            ({'a': u'1'}, {'a': 1}),
+            ({'a': 'x'}, {'a': u'x'}),
+            ({'a': {'b': True}}, {'a': {'b': 1}}),
+            ({'a': {'b': {'c': 0}}}, {'a': {'b': {'c': False}}}),
+            ({'a': [1, 2]}, {'a': [1, 2, 3]}),
+            ({'a': [1, 2, 3]}, {'a': [1, 2]}),
+            ({'a': {'b': 1}}, {'a': [1]}),
+            ({'a': 1}, {'a': 1, 'b/c': 2}),
+            ({'a': 1, 'b~c': 2}, {'a': 1}),
+            ({'a': {'b': 1, 'c': 2}}, {'a': {'b': 1, 'c': 2}}),
+        ]
+        for dst, src in cases:
+            self.assertEqual(make_changes(dst, src), jsonpatch.make_patch(dst, src).patch, (dst, src))
+
+    def test_type_changes(self):
+        # jsonpatch compares list items by ==, so only here
+        self.assertEqual(make_changes([1, 0], [True, False]),
+                         [{'op': 'replace', 'path': '/0', 'value': True},
+                          {'op': 'replace', 'path': '/1', 'value': False}])
+        self.assertEqual(make_changes({'a': 1}, {'a': 1L}), [])
+
+    def test_apply_same_as_jsonpatch(self):
+        rnd = random.Random(2017)
+        for n in range(2000):
+            dst = {u'id': u'x', u'data': random_value(rnd)}
+            src = dst
+            for m in range(rnd.randint(1, 3)):
+                src = mutate(rnd, src)
+            changes = make_changes(dst, src)
+            self.assertEqual(jsonpatch.apply_patch(deepcopy(dst), changes), src)
+            self.assertEqual(jsonpatch.apply_patch(deepcopy(dst), jsonpatch.make_patch(dst, src)), src)
+            if dst == src:
+                self.assertEqual(changes, [])
+
+    def test_revision_changes_revert_patch(self):
+        old = {'status': 'active', 'items': [{'id': 1}, {'id': 2}], 'auctionOptions': {'x': 1}}
+        new = {'status': 'active', 'items': [{'id': 1}, {'id': 3}, {'id': 4}]}
+        changes = get_revision_changes(new, old)
+        self.assertEqual(jsonpatch.apply_patch(deepcopy(new), changes), old)
+        self.assertIn({'op': 'add', 'path': '/auctionOptions', 'value': {'x': 1}}, changes)
+
+    def test_shared_subtrees_skipped(self):
+        shared = {'big': list(range(100))}
+        dst = {'a': shared, 'b': 1}
+        src = {'a': shared, 'b': 2}
+        self.assertEqual(make_changes(dst, src), [{'op': 'replace', 'path': '/b', 'value': 2}])
@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+import threading
+import unittest
+
+from openprocurement.patchdb.models import TenderView
+from openprocurement.patchdb.patcher import PatchApp
+from openprocurement.patchdb.verifier import Verifier
+
+
+class FakeApp(object):
+
+    def __init__(self, fail=()):
+        self.fail = fail
+        self.lock = threading.Lock()
+        self.urls = list()
+
+    def check_url(self, url, check_text):
+        with self.lock:
+            self.urls.append(url)
+        if url in self.fail:
+            raise ValueError("{} not found".format(check_text))
+
+
+class VerifierTest(unittest.TestCase):
+
+    def test_all_checked(self):
+        app = FakeApp()
+        verifier = Verifier(app, concurrency=3)
+        for n in range(20):
+            verifier.submit('url/{}'.format(n), 'UA-{}'.format(n))
+        self.assertTrue(verifier.close())
+        self.assertEqual(sorted(app.urls), sorted('url/{}'.format(n) for n in range(20)))
+        self.assertEqual((verifier.seen, verifier.checked), (20, 20))
+        self.assertEqual(verifier.threads, [])
+
+    def test_failures(self):
+        app = FakeApp(fail=('url/1',))
+        verifier = Verifier(app, concurrency=2)
+        verifier.submit('url/1', 'UA-1')
+        verifier.submit('url/2', 'UA-2')
+        self.assertFalse(verifier.close())
+        self.assertEqual(verifier.checked, 1)
+        self.assertEqual(verifier.failures, [('url/1', 'UA-1', 'ValueError UA-1 not found')])
+
+    def test_threads_started_lazily(self):
+        verifier = Verifier(FakeApp(), concurrency=2)
+        self.assertEqual(verifier.threads, [])
+        self.assertTrue(verifier.close())
+
+
+class CheckEveryTest(unittest.TestCase):
+
+    def app(self, *args):
+        app = PatchApp(['patchdb', 'remove_auction_options', '--input', 'dump.json'] + list(args))
+        app.api_url = 'http://api/tenders'
+        app.checked = list()
+        app.check_url = lambda url, check_text: app.checked.append(url)
+        return app
+
+    def check(self, app, count, check_write=False):
+        for n in range(count):
+            app.check_tender(TenderView({'_id': str(n), 'tenderID': 'UA-{}'.format(n)}), 'UA-{}'.format(n), check_write)
+
+    def test_check_every_inline(self):
+        app = self.app('--check-concurrency', '0', '--check-every', '3')
+        self.check(app, 7)
+        self.assertEqual(app.checked, ['http://api/tenders/0', 'http://api/tenders/3', 'http://api/tenders/6'])
+
+    def test_check_every_background(self):
+        app = self.app('--check-every', '3')
+        app.verifier = Verifier(app, concurrency=2)
+        self.check(app, 7)
+        self.assertTrue(app.verifier.close())
+        self.assertEqual(sorted(app.checked), ['http://api/tenders/0', 'http://api/tenders/3', 'http://api/tenders/6'])
+
+    def test_written_always_checked(self):
+        app = self.app('--check-concurrency', '0', '--check-every', '3', '--write')
+        self.check(app, 4, check_write=True)
+        self.assertEqual(len(app.checked), 4)
@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+import unittest
+from argparse import Namespace
+
+from couchdb.http import ResourceNotFound
+
+from openprocurement.patchdb.views import (DESIGN_DOC, MANGO_DDOC, filter_ranges, narrowest_ranges,
+                                           selector_fields, sync_design_doc, sync_mango_index)
+
+
+class FakeResource(object):
+
+    def __init__(self, indexes):
+        self.indexes = indexes
+        self.posted = list()
+
+    def get_json(self, path):
+        if self.indexes is None:
+            raise ResourceNotFound()
+        return 200, {}, {'indexes': self.indexes}
+
+    def post_json(self, path, body):
+        self.posted.append(body)
+
+
+class FakeDB(object):
+    name = 'test'
+
+    def __init__(self, docs=None, indexes=(), counts=()):
+        self.docs = docs or dict()
+        self.resource = FakeResource(None if indexes is None else list(indexes))
+        self.counts = list(counts)
+        self.saved = list()
+
+    def get(self, docid):
+        return self.docs.get(docid)
+
+    def save(self, doc):
+        self.saved.append(doc)
+
+    def view(self, name, startkey, endkey, reduce):
+        return [{'value': count} for view, start, end, count in self.counts
+                if (view, start, end) == (name, startkey, endkey)]
+
+
+def args(**kwargs):
+    values = dict(doc_type=['Tender'], tenderID=None, after=None, before=None, status=None, method_type=None)
+    values.update(kwargs)
+    return Namespace(**values)
+
+
+class DesignDocTest(unittest.TestCase):
+
+    def test_up_to_date(self):
+        db = FakeDB({DESIGN_DOC['_id']: dict(DESIGN_DOC, _rev='1-a')})
+        self.assertTrue(sync_design_doc(db, install=True))
+        self.assertEqual(db.saved, [])
+
+    def test_missing_without_install(self):
+        db = FakeDB()
+        self.assertFalse(sync_design_doc(db))
+        self.assertEqual(db.saved, [])
+
+    def test_outdated_updated(self):
+        db = FakeDB({DESIGN_DOC['_id']: {'_id': DESIGN_DOC['_id'], '_rev': '1-a', 'views': {}}})
+        self.assertTrue(sync_design_doc(db, install=True))
+        self.assertEqual(db.saved[0]['_rev'], '1-a')
+        self.assertEqual(db.saved[0]['views'], DESIGN_DOC['views'])
+
+
+class MangoIndexTest(unittest.TestCase):
+    selector = {'status': 'active', '$and': [{'value.amount': {'$gt': 1}}], 'doc_type': 'Tender'}
+
+    def test_selector_fields(self):
+        self.assertEqual(selector_fields(self.selector), ['doc_type', 'status', 'value.amount'])
+
+    def test_existing_index(self):
+        db = FakeDB(indexes=[{'ddoc': '_design/' + MANGO_DDOC, 'name': 'by_doc_type_status_value_amount'}])
+        self.assertEqual(sync_mango_index(db, self.selector), [MANGO_DDOC, 'by_doc_type_status_value_amount'])
+
+    def test_missing_index(self):
+        db = FakeDB()
+        self.assertIsNone(sync_mango_index(db, self.selector))
+        self.assertEqual(sync_mango_index(db, self.selector, install=True), [MANGO_DDOC, 'by_doc_type_status_value_amount'])
+        self.assertEqual(db.resource.posted[0]['index'], {'fields': ['doc_type', 'status', 'value.amount']})
+
+    def test_couchdb_1x(self):
+        self.assertRaises(ValueError, sync_mango_index, FakeDB(indexes=None), self.selector)
+
+
+class FilterRangesTest(unittest.TestCase):
+
+    def test_ranges(self):
+        ranges = filter_ranges(args(tenderID=['UA-2', 'UA-1', 'UA-9'], before='UA-5', status=['active']))
+        self.assertEqual(ranges['by_tenderID'], [(['Tender', 'UA-1'], ['Tender', 'UA-1']),
+                                                 (['Tender', 'UA-2'], ['Tender', 'UA-2'])])
+        self.assertEqual(ranges['by_status'], [(['Tender', 'active'], ['Tender', 'active'])])
+        self.assertEqual(ranges['by_method_type'], [(['Tender'], ['Tender', {}])])
+
+    def test_narrowest(self):
+        db = FakeDB(counts=[
+            ('patchdb/by_status', ['Tender', 'active'], ['Tender', 'active'], 10),
+            ('patchdb/by_method_type', ['Tender', 'belowThreshold'], ['Tender', 'belowThreshold'], 3),
+            ('patchdb/by_tenderID', ['Tender'], ['Tender', {}], 100),
+        ])
+        name, ranges, count = narrowest_ranges(db, args(status=['active'], method_type=['belowThreshold']))
+        self.assertEqual((name, count), ('patchdb/by_method_type', 3))
@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+import time
+import errno
+import socket
+import unittest
+from collections import defaultdict
+
+from couchdb.http import ResourceConflict, ServerError
+
+from openprocurement.patchdb.stats import Stats
+from openprocurement.patchdb.writer import BulkWriter
+
+
+class FakeDB(object):
+
+    def __init__(self, results=None, errors=(), current=None):
+        self.results = results or dict()
+        self.errors = list(errors)
+        self.current = current or dict()
+        self.updates = list()
+
+    def update(self, docs):
+        self.updates.append([doc['_id'] for doc in docs])
+        if self.errors:
+            raise self.errors.pop(0)
+        return [self.results.get(doc['_id'], (True, doc['_id'], '2-new')) for doc in docs]
+
+    def view(self, name, keys, include_docs):
+        return [{'id': key, 'doc': self.current[key]} for key in keys if key in self.current]
+
+
+class FakeApp(object):
+
+    def __init__(self, db):
+        self.db = db
+        self.stats = Stats()
+        self.counters = defaultdict(int)
+        self.repatched = list()
+        self.has_error = False
+
+    def safe_inc(self, name, value=1):
+        self.counters[name] += value
+
+    def repatch_tender(self, docid):
+        self.repatched.append(docid)
+
+
+class BulkWriterTest(unittest.TestCase):
+
+    def writer(self, size=2, **kwargs):
+        app = FakeApp(FakeDB(**kwargs))
+        return app, BulkWriter(app, size=size)
+
+    def test_flush_by_size(self):
+        app, writer = self.writer()
+        writer.add({'_id': 'a', '_rev': '1-a'})
+        self.assertEqual(app.db.updates, [])
+        writer.add({'_id': 'b', '_rev': '1-b'})
+        self.assertEqual(app.db.updates, [['a', 'b']])
+        self.assertEqual(app.counters['saved'], 2)
+
+    def test_conflict_repatched(self):
+        app, writer = self.writer(results={'a': (False, 'a', ResourceConflict('conflict'))})
+        writer.add({'_id': 'a', '_rev': '1-a'})
+        writer.add({'_id': 'b', '_rev': '1-b'})
+        self.assertEqual(app.repatched, ['a'])
+        self.assertEqual(app.counters['saved'], 1)
+        self.assertFalse(app.has_error)
+
+    def test_new_document_conflict_is_error(self):
+        app, writer = self.writer(results={'a': (False, 'a', ResourceConflict('conflict'))})
+        writer.add({'_id': 'a'})
+        writer.flush()
+        self.assertEqual(app.repatched, [])
+        self.assertEqual(writer.failed, ['a'])
+        self.assertTrue(app.has_error)
+
+    def test_error_not_raised_into_other_document(self):
+        app, writer = self.writer(results={'a': (False, 'a', ServerError((403, ('forbidden', 'no'))))})
+        writer.add({'_id': 'a', '_rev': '1-a'})
+        writer.add({'_id': 'b', '_rev': '1-b'})
+        self.assertEqual(writer.failed, ['a'])
+        self.assertEqual(app.counters['saved'], 1)
+        self.assertTrue(app.has_error)
+
+    def test_retry_when_not_sent(self):
+        error = socket.error(errno.ECONNREFUSED, 'refused')
+        app, writer = self.writer(size=1, errors=[error])
+        sleep, time.sleep = time.sleep, lambda seconds: None
+        try:
+            writer.add({'_id': 'a', '_rev': '1-a'})
+        finally:
+            time.sleep = sleep
+        self.assertEqual(app.db.updates, [['a'], ['a']])
+        self.assertEqual(app.counters['saved'], 1)
+
+    def test_recover_lost_response(self):
+        current = {
+            'saved': {'_id': 'saved', '_rev': '2-x', 'v': 2},
+            'unchanged': {'_id': 'unchanged', '_rev': '1-u', 'v': 1},
+            'changed': {'_id': 'changed', '_rev': '2-c', 'v': 3},
+        }
+        app, writer = self.writer(size=3, errors=[socket.timeout('timed out')], current=current)
+        writer.add({'_id': 'saved', '_rev': '1-x', 'v': 2})
+        writer.add({'_id': 'unchanged', '_rev': '1-u', 'v': 2})
+        writer.add({'_id': 'changed', '_rev': '1-c', 'v': 2})
+        self.assertEqual(app.db.updates, [['saved', 'unchanged', 'changed'], ['unchanged']])
+        self.assertEqual(app.counters['saved'], 2)
+        self.assertEqual(app.repatched, ['changed'])
+        self.assertFalse(app.has_error)
+
+    def test_wait_for_flush(self):
+        app, writer = self.writer(size=10)
+        writer.add({'_id': 'a', '_rev': '1-a'})
+        writer.flush()
+        writer.wait()
+        self.assertEqual(writer.flushing, set())
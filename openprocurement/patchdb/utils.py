@@ -1,13 +1,17 @@
 # -*- coding: utf-8 -*-
+import json
 import time
+import random
+import Queue
 import logging
-import requests
+import threading
 import functools
-import jsonpatch
 
 
 LOG = logging.getLogger('patchdb')
-SESSION = requests.Session()
+JSON_BACKENDS = ['orjson', 'ujson', 'simplejson', 'cjson', 'json']
+SESSION = None
+API_LIMITER = None
 
 
 def with_retry(tries, delay=1, backoff=2, log_error=LOG.error, expect=Exception, raise_on=None):
@@ -25,7 +29,8 @@ def with_retry(tries, delay=1, backoff=2, log_error=LOG.error, expect=Exception,
                         raise
                     if log_error:
                         log_error("{} {} {}".format(func.__name__, type(e).__name__, e))
-                    for i in range(int(10 * mdelay)):
+                    # jitter spreads retries of concurrent workers
+                    for i in range(int(10 * mdelay * random.uniform(0.5, 1.5))):
                         time.sleep(0.1)
                     mtries -= 1
                     mdelay *= backoff
@@ -37,12 +42,221 @@ def with_retry(tries, delay=1, backoff=2, log_error=LOG.error, expect=Exception,
 @with_retry(tries=3)
 def get_with_retry(url, require_text=''):
     LOG.debug("GET {}".format(url))
-    resp = SESSION.get(url, timeout=30)
+    resp = api_get(url)
     resp.raise_for_status()
     if require_text and require_text not in resp.text:
         raise ValueError('bad response require_text not found')
     return resp.text
 
 
+def api_get(url):
+    if not API_LIMITER:
+        return get_session().get(url, timeout=30)
+    API_LIMITER.acquire()
+    start = time.time()
+    error = True
+    try:
+        resp = get_session().get(url, timeout=30)
+        error = resp.status_code >= 500
+        return resp
+    finally:
+        API_LIMITER.feedback(time.time() - start, error)
+
+
+def set_api_limiter(limiter):
+    global API_LIMITER
+    API_LIMITER = limiter
+
+
+def prefetch(iterable, size):
+    """Iterate in background thread keeping up to size items ahead"""
+    if size < 1:
+        for item in iterable:
+            yield item
+        return
+
+    queue = Queue.Queue(maxsize=size)
+    stop = threading.Event()
+    done = object()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                queue.put(item, timeout=0.1)
+                return True
+            except Queue.Full:
+                pass
+        return False
+
+    def producer():
+        try:
+            for item in iterable:
+                if not put((item, None)):
+                    return
+        except Exception as e:
+            LOG.exception("prefetch {} {}".format(type(e).__name__, e))
+            put((done, e))
+        else:
+            put((done, None))
+
+    thread = threading.Thread(target=producer, name='Prefetch')
+    thread.daemon = True
+    thread.start()
+    try:
+        while True:
+            try:
+                item, error = queue.get(timeout=1)
+            except Queue.Empty:
+                continue
+            if item is done:
+                if error:
+                    raise error
+                break
+            yield item
+    except KeyboardInterrupt:
+        stop.set()
+        raise
+    finally:
+        if not stop.is_set():
+            stop.set()
+            thread.join(30)
+
+
+def json_backend(name=None):
+    """Return (decode, encode) pair same as couchdb.json does for module"""
+    if not name:
+        try:
+            import simplejson  # noqa
+            name = 'simplejson'
+        except ImportError:
+            name = 'json'
+    if name == 'cjson':
+        import cjson
+        return (lambda string, decode=cjson.decode: decode(string.replace('\\/', '/')),
+                cjson.encode)
+    if name == 'orjson':
+        import orjson
+        return (orjson.loads,
+                lambda obj, dumps=orjson.dumps: dumps(obj).decode('utf-8'))
+    if name == 'ujson':
+        import ujson
+        return (ujson.loads,
+                lambda obj, dumps=ujson.dumps: dumps(obj, ensure_ascii=False, escape_forward_slashes=False))
+    module = __import__(name)
+    if name == 'json':
+        # only ascii output uses C accelerated string escaping
+        return (lambda string, loads=module.loads: loads(string),
+                lambda obj, dumps=module.dumps: dumps(obj, allow_nan=False))
+    return (lambda string, loads=module.loads: loads(string),
+            lambda obj, dumps=module.dumps: dumps(obj, allow_nan=False, ensure_ascii=False))
+
+
+def json_sample():
+    item = {'id': 'f' * 32, 'title': u'\u0414\u043e\u043a\u0443\u043c\u0435\u043d\u0442 / title',
+            'url': 'http://host/get/doc?KeyID=1&Signature=a%2Fb', 'amount': 1234567.89,
+            'rate': 0.1, 'small': 1e-07, 'quantity': 12, 'active': True, 'related': None}
+    return {'_id': 'a' * 32, 'items': [dict(item, index=n) for n in range(100)],
+            'nested': {'list': [[1, 2.5, -3], {'key': u'\u2603'}], 'empty': {}}}
+
+
+def check_json_backend(decode, encode, sample):
+    """Backend must round trip sample and be readable by standard json"""
+    text = encode(sample)
+    return decode(text) == sample and json.loads(text) == sample
+
+
+def benchmark_json(decode, encode, sample, seconds=0.2):
+    """Return decode and encode throughput in MB/s"""
+    text = encode(sample)
+    result = list()
+    for func, arg in ((decode, text), (encode, sample)):
+        count = 0
+        start = time.time()
+        while time.time() - start < seconds / 2:
+            func(arg)
+            count += 1
+        result.append(count * len(text) / (time.time() - start) / 1048576.0)
+    return result
+
+
+def select_json_backend(name='auto'):
+    """Return (name, decode, encode) of given or first available backend"""
+    explicit = name and name != 'auto'
+    sample = json_sample()
+    for backend in ([name] if explicit else JSON_BACKENDS):
+        try:
+            decode, encode = json_backend(backend)
+        except ImportError:
+            if explicit:
+                raise
+            continue
+        if not check_json_backend(decode, encode, sample):
+            LOG.warning("JSON backend {} failed round trip check".format(backend))
+            if not explicit:
+                continue
+        return backend, decode, encode
+
+
+def get_session():
+    global SESSION
+    if SESSION is None:
+        import requests
+        SESSION = requests.Session()
+    return SESSION
+
+
+def set_pool_size(size):
+    import requests
+    adapter = requests.adapters.HTTPAdapter(pool_connections=size, pool_maxsize=size)
+    get_session().mount('http://', adapter)
+    get_session().mount('https://', adapter)
+
+
+def escape_pointer(key):
+    return key.replace('~', '~0').replace('/', '~1')
+
+
+def same_value(a, b):
+    # 1 == True == 1.0 in python but not in JSON, str and unicode are same
+    if type(a) is not type(b):
+        if not (isinstance(a, basestring) and isinstance(b, basestring) or
+                type(a) in (int, long) and type(b) in (int, long)):
+            return False
+    return a == b
+
+
+def make_changes(dst, src, path=''):
+    """RFC 6902 patch from dst to src, identical (by identity) subtrees are
+    skipped, dicts are compared by keys, lists by index and scalars by value
+    and JSON type"""
+    if dst is src:
+        return []
+    if isinstance(dst, dict) and isinstance(src, dict):
+        changes = list()
+        for key in dst:
+            if key not in src:
+                changes.append({'op': 'remove', 'path': path + '/' + escape_pointer(key)})
+        for key, value in src.items():
+            if key not in dst:
+                changes.append({'op': 'add', 'path': path + '/' + escape_pointer(key), 'value': value})
+            elif dst[key] is not value:
+                changes.extend(make_changes(dst[key], value, path + '/' + escape_pointer(key)))
+        return changes
+    if isinstance(dst, list) and isinstance(src, list):
+        changes = list()
+        common = min(len(dst), len(src))
+        for i in range(common):
+            if dst[i] is not src[i]:
+                changes.extend(make_changes(dst[i], src[i], '{}/{}'.format(path, i)))
+        for i in reversed(range(common, len(dst))):
+            changes.append({'op': 'remove', 'path': '{}/{}'.format(path, i)})
+        for i in range(common, len(src)):
+            changes.append({'op': 'add', 'path': '{}/{}'.format(path, i), 'value': src[i]})
+        return changes
+    if same_value(dst, src):
+        return []
+    return [{'op': 'replace', 'path': path, 'value': src}]
+
+
 def get_revision_changes(dst, src):
-    return jsonpatch.make_patch(dst, src).patch
+    return make_changes(dst, src)
@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+import Queue
+import threading
+
+from .utils import LOG
+
+
+class Verifier(object):
+    """Check saved documents through API in background threads,
+    threads are started on first check (after fork in processes mode)"""
+
+    def __init__(self, app, concurrency=4):
+        self.app = app
+        self.concurrency = concurrency
+        self.queue = Queue.Queue()
+        self.lock = threading.Lock()
+        self.threads = list()
+        self.seen = 0
+        self.checked = 0
+        self.failures = list()
+
+    def start(self):
+        for index in range(self.concurrency):
+            thread = threading.Thread(target=self.worker, name='Checker-{}'.format(index + 1))
+            thread.daemon = True
+            thread.start()
+            self.threads.append(thread)
+
+    def submit(self, url, check_text):
+        with self.lock:
+            self.seen += 1
+            if not self.threads:
+                self.start()
+        self.queue.put((url, check_text))
+
+    def worker(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            self.check(*item)
+
+    def check(self, url, check_text):
+        try:
+            self.app.check_url(url, check_text)
+        except Exception as e:
+            LOG.error("Check failed {} {} {}".format(url, type(e).__name__, e))
+            with self.lock:
+                self.failures.append((url, check_text, "{} {}".format(type(e).__name__, e)))
+        else:
+            with self.lock:
+                self.checked += 1
+
+    def close(self, cancel=False):
+        if cancel:
+            try:
+                while True:
+                    self.queue.get_nowait()
+            except Queue.Empty:
+                pass
+        for thread in self.threads:
+            self.queue.put(None)
+        for thread in self.threads:
+            while thread.is_alive():
+                thread.join(0.1)
+        self.threads = list()
+        self.report()
+        return not self.failures
+
+    def report(self):
+        if not self.seen:
+            return
+        LOG.info("Checked {} of {} docs {} failed".format(self.checked, self.seen, len(self.failures)))
+        for url, check_text, error in self.failures:
+            LOG.error("Not verified {} {} {}".format(url, check_text, error))
@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+from .utils import LOG
+
+
+DESIGN_NAME = 'patchdb'
+
+ID_MAP_JS = """function(doc) {
+    var tid = null;
+    if (doc.doc_type == 'Tender') tid = doc.tenderID;
+    else if (doc.doc_type == 'Plan') tid = doc.planID;
+    else if (doc.doc_type == 'Contract') tid = doc.contractID || doc.tender_id;
+    else if (doc.doc_type == 'Auction') tid = doc.auctionID;
+    else return;
+    %s
+}"""
+
+DESIGN_DOC = {
+    '_id': '_design/' + DESIGN_NAME,
+    'language': 'javascript',
+    'views': {
+        'by_tenderID': {
+            'map': ID_MAP_JS % "emit([doc.doc_type, tid], null);",
+            'reduce': '_count',
+        },
+        'by_status': {
+            'map': ID_MAP_JS % "emit([doc.doc_type, doc.doc_type == 'Plan' ? 'plan' : doc.status], null);",
+            'reduce': '_count',
+        },
+        'by_method_type': {
+            'map': ID_MAP_JS % """var pmt = doc.procurementMethodType;
+    if (doc.doc_type == 'Plan') pmt = doc.tender ? doc.tender.procurementMethodType : '';
+    if (doc.doc_type == 'Contract') pmt = 'contract';
+    emit([doc.doc_type, pmt], null);""",
+            'reduce': '_count',
+        },
+    }
+}
+
+# separate design document, so it is indexed independently of filter views
+PROJECTION_DOC = {
+    '_id': '_design/patchdb_projection',
+    'language': 'javascript',
+    'views': {
+        'projection': {
+            'map': ID_MAP_JS % """var status = doc.doc_type == 'Plan' ? 'plan' : doc.status;
+    var pmt = doc.procurementMethodType;
+    if (doc.doc_type == 'Plan') pmt = doc.tender ? doc.tender.procurementMethodType : '';
+    if (doc.doc_type == 'Contract') pmt = 'contract';
+    emit([doc.doc_type, tid], [tid, status, pmt, doc.doc_type, doc.dateModified]);""",
+        },
+    }
+}
+PROJECTION_VIEW = 'patchdb_projection/projection'
+
+
+def sync_design_doc(db, install=False, design_doc=DESIGN_DOC):
+    """Install or update design document if views differ, return False
+    if it is missing or outdated and install is not allowed"""
+    current = db.get(design_doc['_id'])
+    if current and current.get('views') == design_doc['views']:
+        return True
+    if not install:
+        LOG.warning("{} not found or outdated, use --sync-views to install".format(design_doc['_id']))
+        return False
+    new = dict(design_doc)
+    if current:
+        new['_rev'] = current['_rev']
+    LOG.warning("Install {} to {}".format(design_doc['_id'], db.name))
+    db.save(new)
+    return True
+
+
+MANGO_DDOC = 'patchdb-mango'
+
+
+def selector_fields(selector):
+    """Return sorted fields required by selector, only those could be indexed"""
+    fields = set()
+    for key, value in selector.items():
+        if key == '$and':
+            for item in value:
+                fields.update(selector_fields(item))
+        elif not key.startswith('$'):
+            fields.add(key)
+    return sorted(fields)
+
+
+def sync_mango_index(db, selector, install=False):
+    """Find or create json index for selector fields, requires CouchDB 2.x"""
+    from couchdb.http import ResourceNotFound
+    fields = selector_fields(selector)
+    if not fields:
+        return None
+    name = 'by_' + '_'.join([f.replace('.', '_') for f in fields])
+    try:
+        status, headers, data = db.resource.get_json('_index')
+    except ResourceNotFound:
+        raise ValueError("{} does not support _index, Mango queries require CouchDB 2.x".format(db.name))
+    for index in data.get('indexes', []):
+        if index.get('ddoc') == '_design/' + MANGO_DDOC and index.get('name') == name:
+            return [MANGO_DDOC, name]
+    if not install:
+        LOG.warning("Mango index {} not found, use --sync-views to install".format(name))
+        return None
+    LOG.warning("Install mango index {} on {} to {}".format(name, ', '.join(fields), db.name))
+    db.resource.post_json('_index', body={'index': {'fields': fields}, 'ddoc': MANGO_DDOC, 'name': name})
+    return [MANGO_DDOC, name]
+
+
+def view_name(name):
+    return '{}/{}'.format(DESIGN_NAME, name)
+
+
+def filter_ranges(args):
+    """Return dict of candidate views with list of (startkey, endkey) ranges
+    each of them covers all documents allowed by command line filters"""
+    candidates = dict()
+    for doc_type in args.doc_type:
+        whole = ([doc_type], [doc_type, {}])
+        if args.tenderID:
+            ranges = [([doc_type, t], [doc_type, t]) for t in sorted(set(args.tenderID))
+                      if (not args.after or t >= args.after) and (not args.before or t <= args.before)]
+        elif args.after or args.before:
+            ranges = [([doc_type, args.after or ''], [doc_type, args.before or {}])]
+        else:
+            ranges = [whole]
+        candidates.setdefault('by_tenderID', []).extend(ranges)
+        if args.status:
+            ranges = [([doc_type, s], [doc_type, s]) for s in sorted(set(args.status))]
+        else:
+            ranges = [whole]
+        candidates.setdefault('by_status', []).extend(ranges)
+        if args.method_type:
+            ranges = [([doc_type, m], [doc_type, m]) for m in sorted(set(args.method_type))]
+        else:
+            ranges = [whole]
+        candidates.setdefault('by_method_type', []).extend(ranges)
+    return candidates
+
+
+def count_range(db, name, startkey, endkey):
+    rows = list(db.view(view_name(name), startkey=startkey, endkey=endkey, reduce=True))
+    return rows[0]['value'] if rows else 0
+
+
+def narrowest_ranges(db, args):
+    best_name, best_ranges, best_count = None, None, None
+    for name, ranges in sorted(filter_ranges(args).items()):
+        count = sum([count_range(db, name, s, e) for s, e in ranges])
+        LOG.debug("View {} matches {} docs".format(name, count))
+        if best_count is None or count < best_count:
+            best_name, best_ranges, best_count = name, ranges, count
+    LOG.info("Use view {} for {} docs".format(best_name, best_count))
+    return view_name(best_name), best_ranges, best_count
@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+import os
+import time
+import errno
+import socket
+import threading
+from couchdb import json
+from couchdb.http import ResourceConflict
+
+from .utils import LOG
+
+
+def request_not_sent(e):
+    # connection failed before request, none of documents reached database
+    return isinstance(e, socket.error) and e.errno in (errno.ECONNREFUSED, errno.EHOSTUNREACH, errno.ENETUNREACH)
+
+
+def same_content(a, b):
+    return (dict((k, v) for k, v in a.items() if k != '_rev') ==
+            dict((k, v) for k, v in b.items() if k != '_rev'))
+
+
+class BulkWriter(object):
+    """Write-behind buffer, saves documents through _bulk_docs"""
+
+    def __init__(self, app, size=100, delay=5.0, pool=None):
+        self.app = app
+        self.size = size
+        self.delay = delay
+        self.pool = pool
+        self.lock = threading.Lock()
+        self.done = threading.Condition(self.lock)
+        self.queue = list()
+        self.first_time = 0
+        self.flush_seq = 0
+        self.flushing = set()
+        self.failed = list()
+
+    def add(self, doc):
+        with self.lock:
+            if not self.queue:
+                self.first_time = time.time()
+            self.queue.append(doc)
+            ready = len(self.queue) >= self.size
+        if ready:
+            self.flush()
+
+    def flush_expired(self):
+        if self.queue and time.time() - self.first_time >= self.delay:
+            self.flush()
+
+    def flush(self):
+        with self.lock:
+            docs, self.queue = self.queue, list()
+            if not docs:
+                return
+            self.flush_seq += 1
+            seq = self.flush_seq
+            self.flushing.add(seq)
+        if self.pool:
+            self.pool.submit(self.flush_tracked, seq, docs)
+        else:
+            self.flush_tracked(seq, docs)
+
+    def flush_tracked(self, seq, docs):
+        # flush runs inside save of other document, never raise into it
+        try:
+            self.flush_docs(docs)
+        except (SystemExit, KeyboardInterrupt):
+            raise
+        except Exception as e:
+            LOG.error("Not saved {} docs {} {}".format(len(docs), type(e).__name__, e))
+            self.set_failed([doc.get('_id') for doc in docs])
+        finally:
+            with self.lock:
+                self.flushing.discard(seq)
+                self.done.notify_all()
+
+    def wait(self):
+        """Wait until flushes started before, maybe by other threads, are finished"""
+        with self.lock:
+            started = set(self.flushing)
+            while started & self.flushing:
+                self.done.wait(0.1)
+
+    def flush_docs(self, docs):
+        conflicts = list()
+        errors = list()
+        for success, docid, rev_or_exc in self.bulk_save(docs):
+            if success:
+                LOG.info("Saved {} rev {}".format(docid, rev_or_exc))
+                self.app.safe_inc('saved')
+            elif isinstance(rev_or_exc, ResourceConflict):
+                conflicts.append(docid)
+            else:
+                errors.append((docid, rev_or_exc))
+        revs = dict((doc['_id'], doc.get('_rev')) for doc in docs if '_id' in doc)
+        for docid in conflicts:
+            if not revs.get(docid):
+                errors.append((docid, ResourceConflict('Document already exists')))
+                continue
+            LOG.warning("Conflict {} patch again".format(docid))
+            try:
+                self.app.repatch_tender(docid)
+            except (SystemExit, KeyboardInterrupt):
+                raise
+            except Exception as e:
+                errors.append((docid, e))
+        for docid, error in errors:
+            LOG.error("Not saved {} {} {}".format(docid, type(error).__name__, error))
+        if errors:
+            self.set_failed([docid for docid, error in errors])
+
+    def set_failed(self, ids):
+        with self.lock:
+            self.failed.extend(ids)
+        self.app.has_error = True
+
+    def bulk_save(self, docs, tries=3):
+        # _bulk_docs is not atomic, repeat it only if nothing was sent
+        for retry in range(tries):
+            try:
+                with self.app.stats.timer('save'):
+                    return self.app.db.update(docs)
+            except (SystemExit, KeyboardInterrupt):
+                raise
+            except Exception as e:
+                LOG.error("bulk_save {} {}".format(type(e).__name__, e))
+                if not request_not_sent(e):
+                    return self.recover(docs)
+                if retry >= tries - 1:
+                    raise
+                time.sleep(retry + 1)
+
+    def recover(self, docs):
+        """Response is lost, fetch current documents: those equal to sent
+        are saved, unchanged are sent again, others are real conflicts"""
+        from couchdb.http import ResourceConflict
+        ids = [doc['_id'] for doc in docs]
+        current = dict()
+        for item in self.app.db.view('_all_docs', keys=ids, include_docs=True):
+            if item.get('doc'):
+                current[item['id']] = item['doc']
+        results, resend = list(), list()
+        for doc in docs:
+            cur = current.get(doc['_id'])
+            if cur and same_content(cur, doc):
+                doc['_rev'] = cur['_rev']
+                results.append((True, doc['_id'], cur['_rev']))
+            elif (cur and cur['_rev']) == doc.get('_rev'):
+                resend.append(doc)
+            else:
+                results.append((False, doc['_id'], ResourceConflict('Document update conflict.')))
+        saved = len([r for r in results if r[0]])
+        LOG.warning("Recover bulk save, {} saved {} resend".format(saved, len(resend)))
+        if resend:
+            with self.app.stats.timer('save'):
+                results.extend(self.app.db.update(resend))
+        return results
+
+
+class FileWriter(object):
+    """Append saved documents to newline delimited JSON file for later
+    _bulk_docs upload, file is reopened after fork"""
+
+    def __init__(self, app, filename):
+        self.app = app
+        self.filename = filename
+        self.lock = threading.Lock()
+        self.fd = None
+        self.pid = None
+
+    def truncate(self):
+        open(self.filename, 'w').close()
+
+    def add(self, doc):
+        line = json.encode(doc)
+        if isinstance(line, unicode):
+            line = line.encode('utf-8')
+        line += '\n'
+        with self.lock:
+            if self.pid != os.getpid():
+                self.fd = os.open(self.filename, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+                self.pid = os.getpid()
+            while line:
+                line = line[os.write(self.fd, line):]
+        LOG.info("Saved {} to {}".format(doc.get('_id'), self.filename))
+        self.app.safe_inc('saved')
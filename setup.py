@@ -45,5 +45,6 @@ setup(
     include_package_data=True,
     zip_safe=False,
     install_requires=requires,
+    test_suite='openprocurement.patchdb.tests',
     entry_points=entry_points
 )